@@ -55,13 +55,20 @@
 import Domoticz
 import solaredge_modbus
 import json
+import hashlib
 
 from datetime import datetime, timedelta
 import time
 from enum import IntEnum, unique, auto
-from pymodbus.exceptions import ConnectionException
+from pymodbus.exceptions import ConnectionException, ModbusException
 import urllib.request
+from urllib.parse import urlsplit
 from importlib.metadata import version, PackageNotFoundError
+from collections import deque
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 #
 # Domoticz shows graphs with intervals of 5 minutes.
@@ -128,7 +135,8 @@ class Maximum:
 from datetime import datetime
 
 class UpdatePeriod:
-    def __init__(self):
+    def __init__(self, clock = datetime.now):
+        self.clock = clock
         self.samples = []
         self.max_samples = 5
         self.prev_update_time = None  # This is used to skip the first reading as that could be old when Domoticz was down
@@ -169,7 +177,7 @@ class UpdatePeriod:
         """Returns seconds between last update and now"""
         if not self.last_update_time:
             return None  # No previous update
-        return (datetime.now() - self.last_update_time).total_seconds()
+        return (self.clock() - self.last_update_time).total_seconds()
 
     def count(self):
         return len(self.samples)
@@ -181,6 +189,448 @@ class UpdatePeriod:
         self.samples.clear()
         self.last_update_time = None
 
+#
+# The HeartbeatStats class keeps track of the time spent in onHeartbeat and the number of device updates.
+# It is used to spot slow cycles and to detect regressions in the scheduling logic.
+#
+
+class HeartbeatStats:
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+        self.device_writes = 0
+        self.skipped = 0
+
+    def update(self, duration):
+        self.count += 1
+        self.total_time += duration
+        self.last_time = duration
+        if duration > self.max_time:
+            self.max_time = duration
+
+    def add_device_write(self):
+        self.device_writes += 1
+
+    def add_skipped(self):
+        self.skipped += 1
+
+    def get(self):
+        if not self.count:
+            return 0.0
+        return self.total_time / self.count
+
+#
+# Domoticz only keeps values with a resolution of 5 minutes, while the inverter can be polled every second.
+#
+# The LineProtocolExporter keeps every sample in a bounded queue and writes them in batches as InfluxDB line protocol.
+# The target can be a local file (rotated when it gets too big), a UDP endpoint or an HTTP endpoint.
+# Batches are written from a separate thread, so exporting doesn't add any delay to onHeartbeat.
+# The thread never calls Domoticz itself; problems are collected and logged by the plugin.
+#
+
+class LineProtocolExporter:
+
+    def __init__(self, options):
+        self.target = urlsplit(options["target"])
+        if self.target.scheme == "udp":
+            if not self.target.hostname or not self.target.port:
+                raise ValueError("UDP export target needs a host and a port: {}".format(options["target"]))
+        elif self.target.scheme in ("http", "https"):
+            if not self.target.hostname:
+                raise ValueError("HTTP export target needs a host: {}".format(options["target"]))
+        elif self.target.scheme in ("", "file"):
+            if not self.target.path:
+                raise ValueError("File export target needs a path: {}".format(options["target"]))
+        else:
+            raise ValueError("Unsupported export target: {}".format(options["target"]))
+
+        self.measurement = options.get("measurement", "solaredge")
+        self.tags = options.get("tags", {})
+        self.batch_size = max(1, int(options.get("batch_size", 500)))
+        self.flush_interval = max(1, int(options.get("flush_interval", 10)))
+        self.max_queue = max(self.batch_size, int(options.get("max_queue", 10000)))
+        self.max_bytes = int(options.get("max_bytes", 10 * 1024 * 1024))
+        self.backup_count = max(1, int(options.get("backup_count", 3)))
+
+        # InfluxDB 2.x and later need an API token; other headers can be added for proxies or other databases.
+
+        self.headers = { "Content-Type": "text/plain; charset=utf-8" }
+        if options.get("token"):
+            self.headers["Authorization"] = "Token {}".format(options["token"])
+        self.headers.update(options.get("headers", {}))
+
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_error = None
+
+    def start(self):
+        self.thread = threading.Thread(name="SolarEdgeExporter", target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+
+    def add(self, timestamp, table, inverter_values):
+        with self.lock:
+            if len(self.queue) >= self.max_queue:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append((timestamp, table, inverter_values))
+            full = len(self.queue) >= self.batch_size
+
+        if full:
+            self.wakeup.set()
+
+    def take_error(self):
+        with self.lock:
+            error = self.last_error
+            self.last_error = None
+        return error
+
+    def run(self):
+        while not self.stopping:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+        self.flush()
+
+    def flush(self):
+        while True:
+            with self.lock:
+                batch = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+            if not batch:
+                return
+
+            lines = []
+            for timestamp, table, inverter_values in batch:
+                line = self.format_line(timestamp, scaled_values(table, inverter_values))
+                if line:
+                    lines.append(line)
+
+            try:
+                self.send(lines)
+            except Exception as e:
+                with self.lock:
+                    self.failed += len(batch)
+                    self.last_error = "{}: {}".format(type(e).__name__, e)
+                return
+            else:
+                with self.lock:
+                    self.exported += len(batch)
+
+    def format_line(self, timestamp, values):
+        fields = ",".join("{}={}".format(escape_key(name), value) for name, value in values.items())
+        if not fields:
+            return None
+
+        tags = "".join(",{}={}".format(escape_key(name), escape_key(str(value))) for name, value in self.tags.items())
+        return "{}{} {} {}".format(escape_key(self.measurement), tags, fields, timestamp)
+
+    def send(self, lines):
+        if not lines:
+            return
+
+        if self.target.scheme == "udp":
+            # Keep the datagrams small enough to avoid fragmentation.
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                chunk = ""
+                for line in lines:
+                    if chunk and len(chunk) + len(line) + 1 > 1400:
+                        sock.sendto(chunk.encode("utf-8"), (self.target.hostname, self.target.port))
+                        chunk = ""
+                    chunk += line + "\n"
+                sock.sendto(chunk.encode("utf-8"), (self.target.hostname, self.target.port))
+
+        elif self.target.scheme in ("http", "https"):
+            request = urllib.request.Request(
+                self.target.geturl(),
+                data=("\n".join(lines) + "\n").encode("utf-8"),
+                headers=self.headers,
+                method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+        else:
+            path = self.target.path
+            if os.path.exists(path) and os.path.getsize(path) >= self.max_bytes:
+                self.rotate(path)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+
+    def rotate(self, path):
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists("{}.{}".format(path, i)):
+                os.replace("{}.{}".format(path, i), "{}.{}".format(path, i + 1))
+        os.replace(path, "{}.1".format(path))
+
+#
+# Escape measurement names, tag keys/values and field keys for InfluxDB line protocol.
+#
+
+def escape_key(key):
+    return key.replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+#
+# Convert the values returned by the inverter into scaled numbers, using the scale factors in the lookup table.
+# Values that are not numeric (like the serial number) are left out.
+#
+
+def scaled_values(table, inverter_values):
+    values = {}
+    for unit in table:
+        name = unit[Column.MODBUSNAME]
+        value = inverter_values.get(name)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if unit[Column.MODBUSSCALE]:
+            scale = inverter_values.get(unit[Column.MODBUSSCALE])
+            if scale is None:
+                continue
+            value = value * (10 ** scale)
+        values[name] = value
+    return values
+
+#
+# The DailyMetrics class calculates some values that are not provided by the inverter itself:
+# - the energy produced since local midnight (based on energy_total),
+# - the highest AC power of the day,
+# - the DC to AC efficiency of the day, weighted by time.
+#
+# Each sample is processed once, so the work doesn't grow during the day.
+# The values are rounded to the precision shown in Domoticz, so an unchanged result can be detected.
+#
+
+class DailyMetrics:
+
+    def __init__(self):
+        self.day = None
+        self.energy_start = None
+        self.peak = 0.0
+        self.energy_ac = 0.0
+        self.energy_dc = 0.0
+        self.last_time = None
+        self.rollover = False
+
+        # Ignore gaps longer than this when integrating the power, e.g. when the inverter was not reachable.
+
+        self.max_gap = 300
+
+    def update(self, now, inverter_values):
+        try:
+            energy_total = inverter_values["energy_total"] * (10 ** inverter_values["energy_total_scale"])
+            power_ac = inverter_values["power_ac"] * (10 ** inverter_values["power_ac_scale"])
+            power_dc = inverter_values["power_dc"] * (10 ** inverter_values["power_dc_scale"])
+        except (KeyError, TypeError):
+            return {}
+
+        today = now.date().isoformat()
+        if self.day != today:
+            self.day = today
+            self.energy_start = energy_total
+            self.peak = 0.0
+            self.energy_ac = 0.0
+            self.energy_dc = 0.0
+            self.last_time = None
+            self.rollover = True
+
+        # The total energy should never go down, but start counting again when the inverter got replaced.
+
+        if self.energy_start is None or energy_total < self.energy_start:
+            self.energy_start = energy_total
+
+        if power_ac > self.peak:
+            self.peak = power_ac
+
+        if self.last_time is not None and power_ac > 0 and power_dc > 0:
+            seconds = (now - self.last_time).total_seconds()
+            if 0 < seconds <= self.max_gap:
+                self.energy_ac += power_ac * seconds
+                self.energy_dc += power_dc * seconds
+        self.last_time = now
+
+        return {
+            "daily_yield": round((energy_total - self.energy_start) / 1000, 3),
+            "peak_power": round(self.peak),
+            "efficiency": round(100 * self.energy_ac / self.energy_dc, 1) if self.energy_dc else 0.0
+        }
+
+    def get_state(self):
+        return { "day": self.day, "energy_start": self.energy_start, "energy_ac": self.energy_ac, "energy_dc": self.energy_dc }
+
+    def set_state(self, state, today, peak = 0.0):
+        # Only restore the state of today; otherwise the next update starts a new day anyway.
+        # The time the plugin was stopped is not integrated, as the first update after a restart has no last_time.
+
+        if state and state.get("day") == today:
+            self.day = state["day"]
+            self.energy_start = state.get("energy_start")
+            self.energy_ac = float(state.get("energy_ac", 0.0))
+            self.energy_dc = float(state.get("energy_dc", 0.0))
+            self.peak = peak
+
+#
+# The ExportController adjusts the active power limit of the inverter to keep the power exported to the grid at a target.
+#
+# It is a PI controller in velocity form: each update adds a change to the output instead of calculating an absolute value.
+# The output starts at the limit reported by the inverter and starts again from there after a manual change.
+# To avoid flooding the inverter with writes, the changes are limited per step, small changes are ignored (hysteresis)
+# and there is a minimum time between two writes. Only writes the inverter accepted are counted; see written().
+# A manual change of the limit holds the controller, until the limit is set back to 100% or for manual_hold seconds.
+#
+
+class ExportController:
+
+    def __init__(self, options):
+        self.rated_power = float(options["rated_power"])
+        self.target = float(options.get("target", 0))
+        self.kp = float(options.get("kp", 0.5))
+        self.ki = float(options.get("ki", 0.1))
+        self.min_limit = float(options.get("min_limit", 0))
+        self.max_limit = float(options.get("max_limit", 100))
+        self.max_step = float(options.get("max_step", 10))
+        self.deadband = float(options.get("deadband", 2))
+        self.min_interval = float(options.get("min_interval", 10))
+        self.max_age = float(options.get("max_age", 30))
+        self.manual_hold = float(options.get("manual_hold", 0))
+
+        self.writes = 0
+        self.stale = False
+        self.held = False
+        self.held_until = None
+        self.reset()
+
+    def reset(self):
+        self.output = None
+        self.last_error = None
+        self.last_time = None
+        self.last_write_time = None
+
+    def update(self, now, grid_power, current_limit):
+        # grid_power is positive when importing from the grid and negative when exporting.
+        # The error is expressed as a percentage of the rated power, the same unit as the limit.
+
+        error = (grid_power + self.target) / self.rated_power * 100
+
+        if self.output is None:
+            self.output = float(current_limit)
+            self.last_time = now
+            self.last_error = error
+            return None
+
+        seconds = min((now - self.last_time).total_seconds(), 60)
+        change = self.kp * (error - self.last_error) + self.ki * error * seconds
+        self.last_time = now
+        self.last_error = error
+
+        # The output is clamped, so it doesn't wind up while the limit can't go any further.
+
+        change = max(-self.max_step, min(self.max_step, change))
+        self.output = max(self.min_limit, min(self.max_limit, self.output + change))
+
+        limit = round(self.output)
+        if limit == round(current_limit):
+            return None
+        if abs(self.output - current_limit) < self.deadband and limit not in (self.min_limit, self.max_limit):
+            return None
+        if self.last_write_time is not None and (now - self.last_write_time).total_seconds() < self.min_interval:
+            return None
+
+        return limit
+
+    def written(self, now):
+        self.last_write_time = now
+        self.writes += 1
+
+    def manual(self, now, level):
+        # Without manual_hold, the manual level is kept until the limit is set back to 100%.
+
+        self.reset()
+        self.held = level < 100
+        self.held_until = now + timedelta(seconds = self.manual_hold) if self.held and self.manual_hold > 0 else None
+
+    def holding(self, now):
+        if self.held_until is not None and now >= self.held_until:
+            self.held = False
+            self.held_until = None
+        return self.held
+
+#
+# The CycleThrottle compares the time spent on each cycle with the effective interval.
+#
+# When cycles keep taking more than their budget (a part of the effective interval), the effective interval is doubled,
+# up to a maximum. When cycles take less than half of their budget for a while, it is halved again until it is back at
+# the configured interval. While throttled, the plugin also skips low priority work, like dumping all values in the debug log.
+#
+
+class CycleThrottle:
+
+    def __init__(self, interval, budget = 0.5, max_factor = 8):
+        self.interval = interval
+        self.budget = budget
+        self.max_factor = max(1, max_factor)
+        self.factor = 1
+        self.over = 0
+        self.under = 0
+        self.events = 0
+        self.next_cycle = None
+
+    def due(self, now):
+        return self.next_cycle is None or now >= self.next_cycle
+
+    def throttled(self):
+        return self.factor > 1
+
+    def get_budget(self):
+        return self.interval * self.factor * self.budget
+
+    def update(self, now, duration):
+        event = None
+        budget = self.get_budget()
+
+        if duration > budget:
+            self.over += 1
+            self.under = 0
+            if self.over >= 3 and self.factor < self.max_factor:
+                self.factor = min(self.factor * 2, self.max_factor)
+                self.over = 0
+                self.events += 1
+                event = "Cycle took {:.2f}s of a {:.2f}s budget; interval stretched to {}s".format(duration, budget, self.interval * self.factor)
+        elif duration < budget / 2:
+            self.under += 1
+            self.over = 0
+            if self.under >= 10 and self.factor > 1:
+                self.factor = self.factor // 2
+                self.under = 0
+                self.events += 1
+                event = "Cycles took less than {:.2f}s; interval restored to {}s".format(budget / 2, self.interval * self.factor)
+        else:
+            self.over = 0
+            self.under = 0
+
+        # The heartbeat itself already takes care of one interval; allow half an interval of jitter.
+
+        if self.factor > 1:
+            self.next_cycle = now + timedelta(seconds = self.interval * (self.factor - 0.5))
+        else:
+            self.next_cycle = None
+
+        return event
+
 #
 # The Unit class lists all possible pieces of information that can be retrieved from the inverter.
 #
@@ -214,6 +664,9 @@ class Unit(IntEnum):
     POWER_DC        = 21
     TEMPERATURE     = 22
     POWERCONTROL    = 23
+    DAILY_YIELD     = 24
+    PEAK_POWER      = 25
+    EFFICIENCY      = 26
 
 #
 # The plugin is using a few tables to setup Domoticz and to process the feedback from the inverter.
@@ -267,7 +720,10 @@ SINGLE_PHASE_INVERTER = [
     [Unit.VOLTAGE_DC,      "DC Voltage",        0xF3,  0x08,     0x00,       {},                     "voltage_dc",      "voltage_dc_scale",     "{:.2f}",  None,           None,                                  Average() ],
     [Unit.POWER_DC,        "DC Power",          0xF8,  0x01,     0x00,       {},                     "power_dc",        "power_dc_scale",       "{:.2f}",  None,           None,                                  Average() ],
     [Unit.TEMPERATURE,     "Temperature",       0xF3,  0x05,     0x00,       {},                     "temperature",     "temperature_scale",    "{:.2f}",  None,           None,                                  Maximum() ],
-    [Unit.POWERCONTROL,    "PowerControl",      0xF4,  0x49,     0x07,       {},                     "active_power_limit", None,                "{:.0f}",  None,           None,                                  None ]
+    [Unit.POWERCONTROL,    "PowerControl",      0xF4,  0x49,     0x07,       {},                     "active_power_limit", None,                "{:.0f}",  None,           None,                                  None ],
+    [Unit.DAILY_YIELD,     "Daily Yield",       0xF3,  0x1F,     0x00,       { "Custom": "1;kWh" },  "daily_yield",     None,                   "{:.3f}",  None,           None,                                  None      ],
+    [Unit.PEAK_POWER,      "Peak Power",        0xF8,  0x01,     0x00,       {},                     "peak_power",      None,                   "{:.0f}",  None,           None,                                  None      ],
+    [Unit.EFFICIENCY,      "Efficiency",        0xF3,  0x06,     0x00,       {},                     "efficiency",      None,                   "{:.1f}",  None,           None,                                  None      ]
 ]
 
 #
@@ -298,9 +754,206 @@ THREE_PHASE_INVERTER = [
     [Unit.VOLTAGE_DC,      "DC Voltage",        0xF3,  0x08,     0x00,       {},                     "voltage_dc",      "voltage_dc_scale",     "{:.2f}",  None,           None,                                  Average() ],
     [Unit.POWER_DC,        "DC Power",          0xF8,  0x01,     0x00,       {},                     "power_dc",        "power_dc_scale",       "{:.2f}",  None,           None,                                  Average() ],
     [Unit.TEMPERATURE,     "Temperature",       0xF3,  0x05,     0x00,       {},                     "temperature",     "temperature_scale",    "{:.2f}",  None,           None,                                  Maximum() ],
-    [Unit.POWERCONTROL,    "PowerControl",      0xF4,  0x49,     0x07,       {},                     "active_power_limit", None,                "{:.3f}",  None,           None,                                  None ]
+    [Unit.POWERCONTROL,    "PowerControl",      0xF4,  0x49,     0x07,       {},                     "active_power_limit", None,                "{:.3f}",  None,           None,                                  None ],
+    [Unit.DAILY_YIELD,     "Daily Yield",       0xF3,  0x1F,     0x00,       { "Custom": "1;kWh" },  "daily_yield",     None,                   "{:.3f}",  None,           None,                                  None      ],
+    [Unit.PEAK_POWER,      "Peak Power",        0xF8,  0x01,     0x00,       {},                     "peak_power",      None,                   "{:.0f}",  None,           None,                                  None      ],
+    [Unit.EFFICIENCY,      "Efficiency",        0xF3,  0x06,     0x00,       {},                     "efficiency",      None,                   "{:.1f}",  None,           None,                                  None      ]
 ]
 
+#
+# Other scripts and dashboards can get the latest values from the plugin itself, instead of polling every device in Domoticz.
+#
+# The SnapshotServer is a small embedded HTTP server running in its own thread:
+# - GET /snapshot returns the latest values as a single json document and supports ETag/If-None-Match.
+#   The ETag only changes when the values change; the time of the last successful read is sent in the X-Updated header.
+# - GET /events is a server-sent-events stream; it starts with the full snapshot and then only sends an event when values
+#   changed, with just the changed values. Values that are no longer available are sent as null.
+#   An idle stream gets a keepalive event with the time of the last successful read.
+#
+# "updated" is the time of the last successful read and "changed" the time the values last changed.
+# When "updated" doesn't advance anymore, the inverter can't be read; otherwise the values are just steady.
+#
+
+class SnapshotServer:
+
+    def __init__(self, options):
+        self.host = options.get("host", "127.0.0.1")
+        self.port = int(options["port"])
+        self.keepalive = max(1, int(options.get("keepalive", 15)))
+
+        self.condition = threading.Condition()
+        self.values = {}
+        self.updated = None
+        self.changed = None
+        self.version = 0
+        self.body = b"{}"
+        self.etag = '"0"'
+        self.subscribers = 0
+        self.stopping = False
+
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        handler = type("Handler", (SnapshotRequestHandler,), { "snapshots": self })
+        self.server = SnapshotHTTPServer((self.host, self.port), handler)
+        self.thread = threading.Thread(name="SolarEdgeSnapshotServer", target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.thread:
+            self.thread.join(timeout=10)
+
+    def publish(self, updated, values):
+        # Called after every successful read, also when the values didn't change.
+        # Steady values only advance "updated"; the body, the ETag and the event streams are left alone.
+
+        if self.version and values == self.values:
+            with self.condition:
+                self.updated = updated
+            return
+
+        body = json.dumps({ "changed": updated, "values": values }).encode("utf-8")
+        with self.condition:
+            self.values = values
+            self.updated = updated
+            self.changed = updated
+            self.version += 1
+            self.body = body
+            self.etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+            self.condition.notify_all()
+
+class SnapshotHTTPServer(ThreadingHTTPServer):
+
+    # Event streams stay connected; a larger backlog avoids dropped connections when many clients connect at once.
+
+    daemon_threads = True
+    request_queue_size = 128
+
+class SnapshotRequestHandler(BaseHTTPRequestHandler):
+
+    snapshots = None
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path in ("/", "/snapshot"):
+            self.send_snapshot()
+        elif path == "/events":
+            self.send_events()
+        else:
+            self.send_error(404)
+
+    def send_snapshot(self):
+        with self.snapshots.condition:
+            body = self.snapshots.body
+            etag = self.snapshots.etag
+            updated = self.snapshots.updated
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("X-Updated", str(updated))
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("ETag", etag)
+        self.send_header("X-Updated", str(updated))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self):
+        snapshots = self.snapshots
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        with snapshots.condition:
+            snapshots.subscribers += 1
+            sent = None
+            version = -1
+
+        try:
+            while True:
+                with snapshots.condition:
+                    snapshots.condition.wait_for(lambda: snapshots.version != version or snapshots.stopping, timeout=snapshots.keepalive)
+                    if snapshots.stopping:
+                        return
+                    changed = snapshots.version != version
+                    version = snapshots.version
+                    values = snapshots.values
+                    updated = snapshots.updated
+                    changed_at = snapshots.changed
+
+                if not changed:
+                    self.wfile.write("event: keepalive\ndata: {}\n\n".format(json.dumps({ "updated": updated })).encode("utf-8"))
+                else:
+                    if sent is None:
+                        event = "snapshot"
+                        data = values
+                    else:
+                        event = "change"
+                        data = { k: v for k, v in values.items() if k not in sent or sent[k] != v }
+                        data.update((k, None) for k in sent if k not in values)
+                    sent = values
+                    self.wfile.write("id: {}\nevent: {}\ndata: {}\n\n".format(
+                        version, event, json.dumps({ "updated": updated, "changed": changed_at, "values": data })).encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with snapshots.condition:
+                snapshots.subscribers -= 1
+
+    def log_message(self, format, *args):
+        # Requests are not logged; Domoticz would get flooded by the event streams.
+        pass
+
+#
+# Calculate the net grid power from a P1 device as returned by the Domoticz json api.
+# Usage is the power imported and UsageDeliv the power exported, both like "350 Watt".
+#
+
+def p1_grid_power(p1):
+    try:
+        return float(p1["Usage"].split()[0]) - float(p1.get("UsageDeliv", "0").split()[0])
+    except (KeyError, ValueError, IndexError, TypeError, AttributeError):
+        return None
+
+#
+# The time of the last update of a P1 device as returned by the Domoticz json api, like "2025-03-01 12:00:05".
+#
+
+def p1_last_update(p1):
+    try:
+        return datetime.strptime(p1["LastUpdate"], "%Y-%m-%d %H:%M:%S")
+    except (KeyError, ValueError, TypeError):
+        return None
+
+#
+# A short signature of the device related columns of a lookup table.
+# It is stored in the discovery cache, so a cached result is not used anymore when a table changes.
+#
+
+def table_layout(table):
+    return hashlib.sha1(json.dumps([
+        [int(unit[Column.ID]), unit[Column.TYPE], unit[Column.SUBTYPE], unit[Column.SWITCHTYPE], unit[Column.OPTIONS], unit[Column.MODBUSNAME], unit[Column.MODBUSSCALE]]
+        for unit in table
+    ]).encode("utf-8")).hexdigest()
+
 #
 # The BasePlugin is the actual Domoticz plugin.
 # This is where the fun starts :-)
@@ -308,7 +961,7 @@ THREE_PHASE_INVERTER = [
 
 class BasePlugin:
 
-    def __init__(self):
+    def __init__(self, clock = datetime.now):
 
         # The _LOOKUP_TABLE will point to one of the tables above, depending on the type of inverter.
 
@@ -322,13 +975,22 @@ class BasePlugin:
 
         self.max_samples = 30
 
+        # All scheduling decisions use this clock.
+        # A simulation can pass a fake clock to fast-forward time.
+
+        self.clock = clock
+
+        # The local Domoticz web server, used to retrieve the P1 device.
+
+        self.domoticz_url = "http://127.0.0.1:8080"
+
         # Sync variables
-        self.pstarttime = datetime.now()
+        self.pstarttime = self.clock()
         self.SE_LastUpdate = None
         self.SE_HalfwayHB = False
         self.p1_idx = 0
         self.p1_HeartBeat = None
-        self.avgupdperiod = UpdatePeriod()
+        self.avgupdperiod = UpdatePeriod(lambda: self.clock())
         self.avgupdperiod.set_max_samples(5)
 
         # Whether the plugin should add missing devices.
@@ -341,7 +1003,44 @@ class BasePlugin:
         # According to the documenation, the inverter may need up to 2 minutes to "reset".
 
         self.retrydelay = timedelta(minutes = 2)
-        self.retryafter = datetime.now() - timedelta(seconds = 1)
+        self.retryafter = self.clock() - timedelta(seconds = 1)
+
+        # Keep track of how long each heartbeat takes and how many device updates it causes.
+
+        self.stats = HeartbeatStats()
+
+        # At night and while clipping the inverter often returns exactly the same values.
+        # The fingerprint of the previous result is used to skip processing those cycles.
+
+        self.fingerprint = None
+        self.unchanged_cycles = 0
+
+        # Optional settings that don't fit in the hardware parameters are read from options.json.
+
+        self.options = {}
+
+        # The optional exporter that writes all samples as InfluxDB line protocol.
+
+        self.exporter = None
+
+        # The optional embedded server that shares the latest values with other consumers.
+
+        self.snapshots = None
+
+        # Daily yield, peak power and efficiency are calculated by the plugin itself.
+
+        self.metrics = DailyMetrics()
+
+        # The optional control loop for the active power limit, based on the grid power reported by the P1 device.
+
+        self.controller = None
+        self.controller_idx = 0
+        self.p1_result = None
+
+        # Stretch the interval when the cycles take longer than the interval allows.
+
+        self.throttle = None
+        self.polled = False
 
     #
     # onStart is called by Domoticz to start the processing of the plugin.
@@ -383,6 +1082,29 @@ class BasePlugin:
         else:
             Domoticz.Debugging(0)
 
+        self.options = self.loadOptions()
+
+        export_options = self.options.get("export", {})
+        if export_options.get("target") and export_options.get("enabled", True):
+            try:
+                self.exporter = LineProtocolExporter(export_options)
+            except ValueError as e:
+                self.displaylog("Exporter disabled: {}".format(e), Log.DERROR)
+            else:
+                self.exporter.start()
+                self.displaylog("Exporting samples to {}".format(export_options["target"]), Log.DSTATUS)
+
+        api_options = self.options.get("api", {})
+        if api_options.get("port") and api_options.get("enabled", True):
+            self.snapshots = SnapshotServer(api_options)
+            try:
+                self.snapshots.start()
+            except OSError as e:
+                self.displaylog("Unable to start snapshot server on port {}: {}".format(api_options["port"], e), Log.DERROR)
+                self.snapshots = None
+            else:
+                self.displaylog("Serving snapshots on http://{}:{}/snapshot".format(self.snapshots.host, self.snapshots.port), Log.DSTATUS)
+
         Domoticz.Debug(
             "onStart Address: {} Port: {} Device Address: {}".format(
                 Parameters["Address"],
@@ -398,10 +1120,49 @@ class BasePlugin:
             unit=int(Parameters["Mode3"]) if Parameters["Mode3"] else 1
         )
 
+        zero_export_options = self.options.get("zero_export", {})
+        if zero_export_options.get("rated_power") and zero_export_options.get("enabled", True):
+            self.controller_idx = int(zero_export_options.get("p1_idx", self.p1_idx))
+            if self.controller_idx > 0:
+                self.controller = ExportController(zero_export_options)
+                self.displaylog("Zero export control with P1 {}; target export {} W".format(self.controller_idx, self.controller.target), Log.DSTATUS)
+            else:
+                self.displaylog("Zero export control needs a P1 device IDX", Log.DERROR)
+
+        throttle_options = self.options.get("throttle", {})
+        if throttle_options.get("enabled", True):
+            self.throttle = CycleThrottle(
+                int(Parameters["Mode2"]),
+                float(throttle_options.get("budget", 0.5)),
+                int(throttle_options.get("max_factor", 8))
+            )
+
+        self.loadMetrics()
+
         # Lets get in touch with the inverter.
 
         self.contactInverter()
 
+    #
+    # onStop is called by Domoticz when the plugin is stopped.
+    # Make sure all threads are finished, Domoticz doesn't like threads that outlive the plugin.
+    #
+
+    def onStop(self):
+        # Keep the efficiency of today when the plugin or Domoticz is restarted.
+
+        if self.metrics.day:
+            self.saveMetrics()
+
+        if self.snapshots:
+            self.snapshots.stop()
+            self.snapshots = None
+
+        if self.exporter:
+            self.exporter.stop()
+            self.displaylog("Exporter stopped: {} exported, {} dropped, {} failed".format(
+                self.exporter.exported, self.exporter.dropped, self.exporter.failed), Log.VERBOSE)
+            self.exporter = None
 
     #
     # OnHeartbeat is called by Domoticz at a specific interval as set in onStart()
@@ -410,12 +1171,68 @@ class BasePlugin:
     def onHeartbeat(self):
         Domoticz.Debug("onHeartbeat")
 
+        start = time.perf_counter()
+        writes = self.stats.device_writes
+
+        self.processHeartbeat()
+
+        self.stats.update(time.perf_counter() - start)
+
+        # Only cycles that polled the inverter say something about the load.
+
+        if self.throttling() and self.polled:
+            event = self.throttle.update(self.clock(), self.stats.last_time)
+            if event:
+                self.displaylog("{} (throttle events: {})".format(event, self.throttle.events), Log.NORMAL)
+
+                # The math objects still need to cover 5 minutes with the stretched interval.
+
+                self.max_samples = 300 / (self.throttle.interval * self.throttle.factor)
+                self.setMathSamples()
+        self.displaylog("Heartbeat took {:.1f} ms ({} device updates); avg {:.1f} ms, max {:.1f} ms over {} heartbeats".format(
+            self.stats.last_time * 1000, self.stats.device_writes - writes,
+            self.stats.get() * 1000, self.stats.max_time * 1000, self.stats.count), Log.DEBUG)
+
+    #
+    # Set the number of samples on all the math objects.
+    #
+
+    def setMathSamples(self):
+        if self._LOOKUP_TABLE and Parameters["Mode4"] == "math_enabled":
+            for unit in self._LOOKUP_TABLE:
+                if unit[Column.MATH]:
+                    unit[Column.MATH].set_max_samples(self.max_samples)
+
+    #
+    # The throttle only applies to the configured interval.
+    # While synced with a P1 device, the heartbeat follows the P1 updates and get_p1_syncsecs decides when to poll,
+    # so skipping cycles would only disturb the sync.
+    #
+
+    def throttling(self):
+        return self.throttle is not None and self.p1_idx == 0
+
+    #
+    # processHeartbeat does the actual work for each heartbeat.
+    #
+
+    def processHeartbeat(self):
+
+        self.p1_result = None
+        self.polled = False
+
         # Calculate the update frequency for P1 idx provided and the Delta after init.
         if self.p1_idx > 0:
             # Time reached to update SE?
             if not self.get_p1_syncsecs():
                 return
 
+        # Skip this cycle when the interval is stretched because of previous slow cycles.
+
+        if self.throttling() and not self.throttle.due(self.clock()):
+            self.displaylog("Throttled; skipping this cycle", Log.DEBUG)
+            return
+
         self.displaylog(f"> Get Solaredge", Log.DEBUG)
 
         # We need to make sure that we have a table to work with.
@@ -425,6 +1242,7 @@ class BasePlugin:
         if self._LOOKUP_TABLE:
             inverter_values = None
 
+            self.polled = True
             try:
                 inverter_values = self.inverter.read_all()
             except ConnectionException:
@@ -433,10 +1251,45 @@ class BasePlugin:
             else:
 
                 if inverter_values:
+
+                    # Add the values that are derived from the inverter values.
+
+                    inverter_values.update(self.metrics.update(self.clock(), inverter_values))
+                    if self.metrics.rollover:
+                        self.metrics.rollover = False
+                        self.saveMetrics()
+
+                    # Adjust the power limit to the grid power; this is needed even when the inverter values didn't change.
+
+                    if self.controller:
+                        self.controlExport(inverter_values)
+
+                    # Hand over every sample to the exporter, before anything gets skipped.
+
+                    if self.exporter:
+                        self.exporter.add(int(self.clock().timestamp() * 1000) * 1000000, self._LOOKUP_TABLE, inverter_values)
+                        error = self.exporter.take_error()
+                        if error:
+                            self.displaylog("Exporter failed: {} ({} dropped, {} failed so far)".format(
+                                error, self.exporter.dropped, self.exporter.failed), Log.NORMAL)
+
+                    # Share the latest values with other consumers; also when they didn't change, so they can see the read succeeded.
+
+                    if self.snapshots:
+                        self.snapshots.publish(self.clock().isoformat(timespec="seconds"), scaled_values(self._LOOKUP_TABLE, inverter_values))
+
+                    # Skip processing when nothing changed since the previous cycle.
+
+                    if self.snapshotUnchanged(inverter_values):
+                        self.stats.add_skipped()
+                        self.displaylog("SE values unchanged; skipped processing ({} cycles skipped)".format(self.stats.skipped), Log.DEBUG)
+                        return
+
                     # Remove Serial from log?
                     # if "c_serialnumber" in inverter_values:
                     #     inverter_values.pop("c_serialnumber")
-                    self.displaylog("inverter values : {}".format(json.dumps(inverter_values, indent=4, sort_keys=False)), Log.DEBUG)
+                    if not (self.throttling() and self.throttle.throttled()):
+                        self.displaylog("inverter values : {}".format(json.dumps(inverter_values, indent=4, sort_keys=False)), Log.DEBUG)
 
                     updated = 0
                     device_count = 0
@@ -549,6 +1402,7 @@ class BasePlugin:
                             if nValue != Devices[unit[Column.ID ]].nValue or (nValue == Devices[unit[Column.ID]].nValue and sValue != Devices[unit[Column.ID]].sValue):
                                 self.displaylog("Device: {} nValue = {} sValue = {}".format(unit[Column.NAME], nValue, sValue), Log.DEBUG)
                                 Devices[unit[Column.ID]].Update(nValue=nValue, sValue=str(sValue), TimedOut=0)
+                                self.stats.add_device_write()
                                 updated += 1
 
                         else:
@@ -574,20 +1428,118 @@ class BasePlugin:
             self.displaylog(f"Send active_power_limit Level {Level} to SolarEdge", Log.DSTATUS)
             self.inverter.write("active_power_limit", Level)
 
+            # The zero export control leaves a manual level alone; it takes over again at 100% or after the manual hold.
+
+            if self.controller:
+                self.controller.manual(self.clock(), Level)
+                if self.controller.held:
+                    self.displaylog("Zero export control held at active_power_limit {}".format(Level), Log.DSTATUS)
+
+            # Domoticz already changed the device; make sure the next cycle processes the values again.
+
+            self.fingerprint = None
+
+    #
+    # Run the zero export control loop with the latest grid power of the P1 device.
+    # The P1 information retrieved for syncing is reused when it was read during this heartbeat.
+    #
+
+    def controlExport(self, inverter_values):
+        if "active_power_limit" not in inverter_values:
+            return
+
+        now = self.clock()
+        if self.controller.held:
+            if self.controller.holding(now):
+                return
+            self.displaylog("Manual hold ended; zero export control resumed", Log.VERBOSE)
+
+        p1 = self.p1_result if self.p1_result and int(self.p1_result.get("idx", 0)) == self.controller_idx else self.get_p1_device(self.controller_idx)
+        grid_power = p1_grid_power(p1)
+        if grid_power is None:
+            self.displaylog("No grid power available from P1 {}".format(self.controller_idx), Log.VERBOSE)
+            return
+
+        # A P1 reading that is a few P1 periods old says nothing about the current grid power.
+        # The limit is kept as it is and the controller starts again from the inverter limit once the P1 device updates.
+
+        last_update = p1_last_update(p1)
+        max_age = self.controller.max_age
+        if self.controller_idx == self.p1_idx:
+            max_age = max(max_age, 3 * self.avgupdperiod.get())
+        if last_update is None or (now - last_update).total_seconds() > max_age:
+            if not self.controller.stale:
+                self.displaylog("P1 {} has not been updated for more than {}s; zero export control paused".format(self.controller_idx, round(max_age)), Log.VERBOSE)
+            self.controller.stale = True
+            self.controller.reset()
+            return
+        if self.controller.stale:
+            self.displaylog("P1 {} is updated again; zero export control resumed".format(self.controller_idx), Log.VERBOSE)
+            self.controller.stale = False
+
+        limit = self.controller.update(now, grid_power, inverter_values["active_power_limit"])
+        if limit is None:
+            return
+
+        self.displaylog("Zero export: grid {} W, active_power_limit {} -> {} ({} writes)".format(
+            grid_power, inverter_values["active_power_limit"], limit, self.controller.writes), Log.VERBOSE)
+        try:
+            result = self.inverter.write("active_power_limit", limit)
+        except ModbusException:
+            result = None
+        if result is None or result.isError():
+            self.displaylog("Unable to write active_power_limit", Log.DERROR)
+            return
+        self.controller.written(now)
+
+    #
+    # Check whether the inverter returned exactly the same values as in the previous cycle.
+    #
+    # The math objects only need the repeated value until their sliding window is completely filled with it.
+    # After that, processing the same values again can not change any device, so the whole cycle can be skipped.
+    #
+
+    def snapshotUnchanged(self, inverter_values):
+        fingerprint = hash(tuple(inverter_values.items()))
+
+        if fingerprint != self.fingerprint:
+            self.fingerprint = fingerprint
+            self.unchanged_cycles = 0
+            return False
+
+        if Parameters["Mode4"] == "math_enabled" and self.unchanged_cycles < self.max_samples:
+            self.unchanged_cycles += 1
+            return False
+
+        return True
+
     #
     # Contact the inverter and find out what type it is.
     # Initialize the lookup table when the type is supported.
     #
+    # The outcome of a full discovery is cached on disk. When the inverter still has the same serial number,
+    # the next (re)start only needs to read the serial number instead of all registers.
+    #
 
     def contactInverter(self):
 
         # Do not stress the inverter when it did not respond in the previous attempt to contact it.
 
-        if self.retryafter <= datetime.now():
+        if self.retryafter <= self.clock():
 
             # Here we go...
-            inverter_values = None
+            cached = self.loadDiscoveryCache().get(self.discoveryKey())
             try:
+                if cached:
+                    identity = self.inverter.read("c_serialnumber")
+                    if identity and identity.get("c_serialnumber") == cached["serial"]:
+                        self.displaylog("Connection established with: {}:{} Device Address: {}".format(Parameters["Address"], Parameters["Port"], Parameters["Mode3"]), Log.DSTATUS)
+                        self.displaylog("Using cached discovery for inverter {}".format(cached["serial"]), Log.VERBOSE)
+                        self.setupInverter(cached["sunspec_did"], cached["serial"], cached)
+                        return
+
+                    self.displaylog("Inverter identity changed; running a full discovery", Log.VERBOSE)
+
                 inverter_values = self.inverter.read_all()
             except ConnectionException:
 
@@ -598,8 +1550,7 @@ class BasePlugin:
                 # - The inverter has a bad hairday....
                 # Try again in the future.
 
-                self.retryafter = datetime.now() + self.retrydelay
-                inverter_values = None
+                self.retryafter = self.clock() + self.retrydelay
 
                 self.displaylog("Connection Exception when trying to contact: {}:{} Device Address: {}".format(Parameters["Address"], Parameters["Port"], Parameters["Mode3"]), Log.NORMAL)
                 self.displaylog("Retrying to communicate with inverter after: {}".format(self.retryafter), Log.NORMAL)
@@ -609,78 +1560,189 @@ class BasePlugin:
                 if inverter_values:
                     self.displaylog("Connection established with: {}:{} Device Address: {}".format(Parameters["Address"], Parameters["Port"], Parameters["Mode3"]), Log.DSTATUS)
 
-                    try:
-                        inverter_type = solaredge_modbus.sunspecDID(inverter_values["c_sunspec_did"])
-                    except Exception as e:
+                    if "c_sunspec_did" not in inverter_values:
                         self.displaylog("Returned modbus data doesn't contain c_sunspec_did ..  will retry")
                         return
 
-                    self.displaylog("Inverter type: {}".format(inverter_type), Log.DSTATUS)
+                    self.setupInverter(inverter_values["c_sunspec_did"], inverter_values.get("c_serialnumber"), None)
+                else:
+                    self.displaylog("Connection established with: {}:{} Device Address: {}. BUT... inverter returned no information".format(Parameters["Address"], Parameters["Port"], Parameters["Mode3"]))
+                    self.displaylog("Retrying to communicate with inverter after: {}".format(self.retryafter))
+        else:
+            self.displaylog("Retrying to communicate with inverter after: {}".format(self.retryafter))
 
-                    # The plugin currently has 2 supported types.
-                    # This may be updated in the future based on user feedback.
+    #
+    # Select the lookup table for the inverter type and make sure the devices match it.
+    # When the cached discovery shows that the devices were already checked against the same table, that check is skipped.
+    #
 
-                    if inverter_type == solaredge_modbus.sunspecDID.SINGLE_PHASE_INVERTER:
-                        self._LOOKUP_TABLE = SINGLE_PHASE_INVERTER
-                    elif inverter_type == solaredge_modbus.sunspecDID.THREE_PHASE_INVERTER:
-                        self._LOOKUP_TABLE = THREE_PHASE_INVERTER
-                    else:
-                        self.displaylog("Unsupported inverter type: {}".format(inverter_type), Log.DERROR)
+    def setupInverter(self, sunspec_did, serial, cached):
+        try:
+            inverter_type = solaredge_modbus.sunspecDID(sunspec_did)
+        except Exception as e:
+            self.displaylog("Unsupported inverter type: {}".format(sunspec_did), Log.DERROR)
+            return
 
-                    if self._LOOKUP_TABLE:
+        self.displaylog("Inverter type: {}".format(inverter_type), Log.DSTATUS)
 
-                        # Set the number of samples on all the math objects.
+        # The plugin currently has 2 supported types.
+        # This may be updated in the future based on user feedback.
 
-                        for unit in self._LOOKUP_TABLE:
-                            if unit[Column.MATH]  and Parameters["Mode4"] == "math_enabled":
-                                unit[Column.MATH].set_max_samples(self.max_samples)
+        if inverter_type == solaredge_modbus.sunspecDID.SINGLE_PHASE_INVERTER:
+            self._LOOKUP_TABLE = SINGLE_PHASE_INVERTER
+        elif inverter_type == solaredge_modbus.sunspecDID.THREE_PHASE_INVERTER:
+            self._LOOKUP_TABLE = THREE_PHASE_INVERTER
+        else:
+            self.displaylog("Unsupported inverter type: {}".format(inverter_type), Log.DERROR)
 
+        if self._LOOKUP_TABLE:
 
-                        # We updated some device types over time.
-                        # Let's make sure that we have the correct type setup.
+            # Set the number of samples on all the math objects.
 
-                        for unit in self._LOOKUP_TABLE:
-                            if unit[Column.ID] in Devices:
-                                device = Devices[unit[Column.ID]]
+            self.setMathSamples()
 
-                                if (device.Type != unit[Column.TYPE] or
-                                    device.SubType != unit[Column.SUBTYPE] or
-                                    device.SwitchType != unit[Column.SWITCHTYPE] or
-                                    device.Options != unit[Column.OPTIONS]):
+            # We updated some device types over time.
+            # Let's make sure that we have the correct type setup.
 
-                                    self.displaylog("Updating device \"{}\"".format(device.Name))
+            layout = table_layout(self._LOOKUP_TABLE)
+            checked = sorted(unit[Column.ID] for unit in self._LOOKUP_TABLE if unit[Column.ID] in Devices)
 
-                                    nValue = device.nValue
-                                    sValue = device.sValue
+            if cached and cached.get("layout") == layout and cached.get("devices") == checked:
+                self.displaylog("Devices already match the inverter type", Log.DEBUG)
+            else:
+                for unit in self._LOOKUP_TABLE:
+                    if unit[Column.ID] in Devices:
+                        device = Devices[unit[Column.ID]]
+
+                        if (device.Type != unit[Column.TYPE] or
+                            device.SubType != unit[Column.SUBTYPE] or
+                            device.SwitchType != unit[Column.SWITCHTYPE] or
+                            device.Options != unit[Column.OPTIONS]):
+
+                            self.displaylog("Updating device \"{}\"".format(device.Name))
+
+                            nValue = device.nValue
+                            sValue = device.sValue
+
+                            device.Update(
+                                    Type=unit[Column.TYPE],
+                                    Subtype=unit[Column.SUBTYPE],
+                                    Switchtype=unit[Column.SWITCHTYPE],
+                                    Options=unit[Column.OPTIONS],
+                                    nValue=nValue,
+                                    sValue=sValue
+                            )
+
+            # Add missing devices if needed.
+
+            if self.add_devices:
+                for unit in self._LOOKUP_TABLE:
+                    if unit[Column.ID] not in Devices:
+                        Domoticz.Device(
+                            Unit=unit[Column.ID],
+                            Name=unit[Column.NAME],
+                            Type=unit[Column.TYPE],
+                            Subtype=unit[Column.SUBTYPE],
+                            Switchtype=unit[Column.SWITCHTYPE],
+                            Options=unit[Column.OPTIONS],
+                            Used=1,
+                        ).Create()
+
+            # Remember the outcome, so the next start can skip the full discovery.
+
+            if serial:
+                self.saveDiscoveryCache({
+                    "serial": serial,
+                    "sunspec_did": int(sunspec_did),
+                    "layout": layout,
+                    "devices": sorted(unit[Column.ID] for unit in self._LOOKUP_TABLE if unit[Column.ID] in Devices)
+                })
 
-                                    device.Update(
-                                            Type=unit[Column.TYPE],
-                                            Subtype=unit[Column.SUBTYPE],
-                                            Switchtype=unit[Column.SWITCHTYPE],
-                                            Options=unit[Column.OPTIONS],
-                                            nValue=nValue,
-                                            sValue=sValue
-                                    )
+    #
+    # The discovery cache is a json file in the plugin folder.
+    # It can hold multiple inverters; each one is stored under its address, port and modbus device address.
+    #
 
-                        # Add missing devices if needed.
+    def discoveryKey(self):
+        return "{}:{}/{}".format(Parameters["Address"], Parameters["Port"], Parameters["Mode3"] or 1)
 
-                        if self.add_devices:
-                            for unit in self._LOOKUP_TABLE:
-                                if unit[Column.ID] not in Devices:
-                                    Domoticz.Device(
-                                        Unit=unit[Column.ID],
-                                        Name=unit[Column.NAME],
-                                        Type=unit[Column.TYPE],
-                                        Subtype=unit[Column.SUBTYPE],
-                                        Switchtype=unit[Column.SWITCHTYPE],
-                                        Options=unit[Column.OPTIONS],
-                                        Used=1,
-                                    ).Create()
-                else:
-                    self.displaylog("Connection established with: {}:{} Device Address: {}. BUT... inverter returned no information".format(Parameters["Address"], Parameters["Port"], Parameters["Mode3"]))
-                    self.displaylog("Retrying to communicate with inverter after: {}".format(self.retryafter))
-        else:
-            self.displaylog("Retrying to communicate with inverter after: {}".format(self.retryafter))
+    def discoveryCacheFile(self):
+        return os.path.join(Parameters.get("HomeFolder", ""), "discovery_cache.json")
+
+    def loadDiscoveryCache(self):
+        try:
+            with open(self.discoveryCacheFile(), encoding="utf-8") as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.displaylog("Ignoring discovery cache: {}".format(e), Log.VERBOSE)
+            return {}
+
+        return cache if isinstance(cache, dict) else {}
+
+    def saveDiscoveryCache(self, entry):
+        cache = self.loadDiscoveryCache()
+        if cache.get(self.discoveryKey()) == entry:
+            return
+
+        cache[self.discoveryKey()] = entry
+        try:
+            with open(self.discoveryCacheFile(), "w", encoding="utf-8") as f:
+                json.dump(cache, f, indent=4)
+        except OSError as e:
+            self.displaylog("Unable to write discovery cache: {}".format(e), Log.VERBOSE)
+
+    #
+    # The start of the day for the derived metrics is stored in the plugin configuration in Domoticz.
+    # It is only saved once a day, when the day changes.
+    # The peak power of today is taken from the device itself.
+    #
+
+    def loadMetrics(self):
+        try:
+            state = Domoticz.Configuration().get("DailyMetrics")
+        except Exception as e:
+            self.displaylog("Unable to read the daily metrics: {}".format(e), Log.VERBOSE)
+            return
+
+        today = self.clock().date().isoformat()
+        peak = 0.0
+        if Unit.PEAK_POWER in Devices and Devices[Unit.PEAK_POWER].LastUpdate.startswith(today):
+            try:
+                peak = float(Devices[Unit.PEAK_POWER].sValue)
+            except ValueError:
+                pass
+
+        self.metrics.set_state(state, today, peak)
+
+    def saveMetrics(self):
+        try:
+            config = Domoticz.Configuration()
+            config["DailyMetrics"] = self.metrics.get_state()
+            Domoticz.Configuration(config)
+        except Exception as e:
+            self.displaylog("Unable to save the daily metrics: {}".format(e), Log.VERBOSE)
+
+    #
+    # Read the optional settings from options.json in the plugin folder.
+    # A missing file is fine; the plugin then runs with the hardware parameters only.
+    #
+
+    def loadOptions(self):
+        filename = os.path.join(Parameters.get("HomeFolder", ""), "options.json")
+        if not os.path.isfile(filename):
+            return {}
+
+        try:
+            with open(filename, encoding="utf-8") as f:
+                options = json.load(f)
+        except (OSError, ValueError) as e:
+            self.displaylog("Ignoring {}: {}".format(filename, e), Log.DERROR)
+            return {}
+
+        self.displaylog("Loaded options from {}".format(filename), Log.VERBOSE)
+        return options
 
     def displaylog(self, msg, level=Log.NORMAL):
         # Default = Normal
@@ -708,9 +1770,19 @@ class BasePlugin:
         elif level == Log.DERROR:
             Domoticz.Error(f"{msg}")
 
+    # Function to retrieve the P1 device info from Domoticz
+    def get_p1_device(self, idx):
+        url = f"{self.domoticz_url}/json.htm?type=command&param=getdevices&rid={idx}"
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                return json.loads(response.read().decode('utf-8'))["result"][0]
+        except Exception as e:
+            self.displaylog(f"Error retrieving P1 device {idx}: {e}", Log.DEBUG)
+            return None
+
     # Function to retrieve P1 info to sync with SE info
     def get_p1_syncsecs(self):
-        url = f"http://127.0.0.1:8080/json.htm?type=command&param=getdevices&rid={self.p1_idx}"
+        url = f"{self.domoticz_url}/json.htm?type=command&param=getdevices&rid={self.p1_idx}"
         P1Delta = 0
         last_update_str = ""
         p1_dev_name = ""
@@ -736,6 +1808,7 @@ class BasePlugin:
             last_update_str = data["result"][0]["LastUpdate"]
             p1_dev_name = data["result"][0]["Name"]
             p1_dev_idx = data["result"][0]["idx"]
+            self.p1_result = data["result"][0]
 
         except Exception as e:
             if self.p1_HeartBeat and Domoticz.Heartbeat() == self.p1_HeartBeat:
@@ -757,7 +1830,7 @@ class BasePlugin:
         self.avgupdperiod.update(last_update_str)
         P1Delta = int(self.avgupdperiod.seconds_last_update())
 
-        if P1Delta > 60 and (datetime.now() - self.pstarttime).total_seconds() >= 60:
+        if P1Delta > 60 and (self.clock() - self.pstarttime).total_seconds() >= 60:
             if self.p1_HeartBeat:
                 self.p1_HeartBeat = int(Parameters["Mode2"])
                 self.p1_idx = 0
@@ -807,17 +1880,16 @@ class BasePlugin:
             self.displaylog(f"-> {self.avgupdperiod.count()} avg-> {round(self.avgupdperiod.get())}  P1Delta:{P1Delta}  lastupdate: {last_update_str}", Log.DEBUG)
 
             #seconds_last_update
-            if self.SE_LastUpdate is None or (datetime.now() - self.SE_LastUpdate).total_seconds() >= int(Parameters["Mode2"]):
+            if self.SE_LastUpdate is None or (self.clock() - self.SE_LastUpdate).total_seconds() >= int(Parameters["Mode2"]):
                 upd_SE = True
 
         if upd_SE:
-            self.SE_LastUpdate = datetime.now()
+            self.SE_LastUpdate = self.clock()
 
         return upd_SE
 
 #
 # Instantiate the plugin and register the supported callbacks.
-# Currently that is only onStart() and onHeartbeat()
 #
 
 global _plugin
@@ -827,6 +1899,10 @@ def onStart():
     global _plugin
     _plugin.onStart()
 
+def onStop():
+    global _plugin
+    _plugin.onStop()
+
 def onHeartbeat():
     global _plugin
     _plugin.onHeartbeat()
@@ -0,0 +1,150 @@
+#
+# Benchmark of the SnapshotServer with many concurrent local subscribers.
+#
+# Opens a number of /events streams and /snapshot pollers (using If-None-Match), publishes a series of snapshots
+# and reports the time spent in publish() and the delay until each subscriber received the change.
+#
+# Usage: python tests/bench_snapshot.py --subscribers 200 --pollers 10 --publishes 100 --interval 0.05
+#
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import domoticz_stub
+
+sys.modules.setdefault("Domoticz", domoticz_stub)
+
+import plugin
+
+VALUES = {
+    "status": 4, "vendor_status": 0, "current": 12.34, "l1_current": 4.1, "l2_current": 4.1, "l3_current": 4.1,
+    "l1_voltage": 400.0, "l2_voltage": 400.0, "l3_voltage": 400.0, "l1n_voltage": 230.0, "l2n_voltage": 230.0,
+    "l3n_voltage": 230.0, "power_ac": 2500, "frequency": 50.0, "power_apparent": 2500, "power_reactive": 0,
+    "power_factor": 100, "energy_total": 1000000, "current_dc": 6.6, "voltage_dc": 390.0, "power_dc": 2575,
+    "temperature": 45.0, "active_power_limit": 100,
+}
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(subscribers = 100, pollers = 5, publishes = 50, interval = 0.05):
+    server = plugin.SnapshotServer({ "port": free_port(), "keepalive": 60 })
+    server.start()
+
+    received = {}
+    connected = threading.Semaphore(0)
+    lock = threading.Lock()
+    stop_polling = threading.Event()
+    polls = { 200: 0, 304: 0 }
+
+    def subscribe():
+        connection = http.client.HTTPConnection(server.host, server.port, timeout = 30)
+        connection.request("GET", "/events")
+        response = connection.getresponse()
+        event_id = None
+        first = True
+        while True:
+            line = response.fp.readline()
+            if not line:
+                break
+            if line.startswith(b"id: "):
+                event_id = int(line[4:])
+            elif line.startswith(b"data: "):
+                now = time.perf_counter()
+                if first:
+                    first = False
+                    connected.release()
+                    continue
+                with lock:
+                    received.setdefault(event_id, []).append(now)
+        connection.close()
+
+    def poll():
+        connection = http.client.HTTPConnection(server.host, server.port, timeout = 30)
+        etag = None
+        while not stop_polling.is_set():
+            connection.request("GET", "/snapshot", headers = { "If-None-Match": etag } if etag else {})
+            response = connection.getresponse()
+            response.read()
+            etag = response.getheader("ETag")
+            with lock:
+                polls[response.status] = polls.get(response.status, 0) + 1
+            time.sleep(interval / 4)
+        connection.close()
+
+    threads = [threading.Thread(target = subscribe, daemon = True) for _ in range(subscribers)]
+    threads += [threading.Thread(target = poll, daemon = True) for _ in range(pollers)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 30
+    for _ in range(subscribers):
+        if not connected.acquire(timeout = max(0, deadline - time.monotonic())):
+            raise RuntimeError("Not all subscribers connected")
+
+    published = {}
+    costs = []
+    values = dict(VALUES)
+    for i in range(publishes):
+        values = dict(values, power_ac = 2500 + i)
+        start = time.perf_counter()
+        server.publish("2026-06-01T12:00:{:02d}".format(i % 60), values)
+        costs.append(time.perf_counter() - start)
+        published[server.version] = start
+        time.sleep(interval)
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        with lock:
+            if all(len(received.get(version, [])) >= subscribers for version in published):
+                break
+        time.sleep(0.05)
+
+    stop_polling.set()
+    server.stop()
+
+    latencies = [t - published[version] for version, times in received.items() if version in published for t in times]
+    return {
+        "subscribers": subscribers,
+        "publishes": publishes,
+        "delivered": len(latencies),
+        "expected": subscribers * publishes,
+        "publish_mean_ms": statistics.mean(costs) * 1000,
+        "publish_max_ms": max(costs) * 1000,
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "latency_max_ms": max(latencies, default = 0.0) * 1000,
+        "polls_200": polls.get(200, 0),
+        "polls_304": polls.get(304, 0),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("--subscribers", type = int, default = 100)
+    parser.add_argument("--pollers", type = int, default = 5)
+    parser.add_argument("--publishes", type = int, default = 50)
+    parser.add_argument("--interval", type = float, default = 0.05)
+    args = parser.parse_args()
+
+    print(json.dumps(run(args.subscribers, args.pollers, args.publishes, args.interval), indent = 4))
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import domoticz_stub
+
+sys.modules["Domoticz"] = domoticz_stub
+
+import plugin
+
+
+def parameters(home_folder, **overrides):
+    values = {
+        "Address": "127.0.0.1",
+        "Port": "502",
+        "Mode1": "Yes",
+        "Mode2": "5",
+        "Mode3": "1",
+        "Mode4": "math_enabled",
+        "Mode5": "1",
+        "Mode6": "0",
+        "HomeFolder": str(home_folder) + os.sep,
+        "HardwareID": 1,
+    }
+    values.update(overrides)
+    return values
+
+
+@pytest.fixture
+def domoticz(tmp_path):
+    """Reset the Domoticz stub and connect it to the plugin module."""
+    domoticz_stub.reset()
+    plugin.Devices = domoticz_stub.Devices
+    plugin.Parameters = parameters(tmp_path)
+    yield domoticz_stub
+    domoticz_stub.reset()
@@ -0,0 +1,83 @@
+#
+# A stub of the Domoticz module that is available to plugins running inside Domoticz.
+#
+# It keeps the log messages, the heartbeat interval, the plugin configuration and the devices in memory,
+# so the plugin can be run without Domoticz.
+#
+
+Devices = {}
+Messages = []
+Settings = { "Heartbeat": 10, "Configuration": {} }
+
+
+def reset():
+    Devices.clear()
+    Messages.clear()
+    Settings["Heartbeat"] = 10
+    Settings["Configuration"] = {}
+
+
+def Debug(msg):
+    pass
+
+
+def Log(msg):
+    Messages.append(("Log", msg))
+
+
+def Status(msg):
+    Messages.append(("Status", msg))
+
+
+def Error(msg):
+    Messages.append(("Error", msg))
+
+
+def Debugging(level):
+    pass
+
+
+def Heartbeat(interval = None):
+    if interval is None:
+        return Settings["Heartbeat"]
+    Settings["Heartbeat"] = interval
+
+
+def Configuration(config = None):
+    if config is not None:
+        Settings["Configuration"] = dict(config)
+    return dict(Settings["Configuration"])
+
+
+class Device:
+
+    def __init__(self, Name, Unit, Type, Subtype = 0, Switchtype = 0, Options = None, Used = 0):
+        self.Name = Name
+        self.Unit = Unit
+        self.Type = Type
+        self.SubType = Subtype
+        self.SwitchType = Switchtype
+        self.Options = Options or {}
+        self.Used = Used
+        self.nValue = 0
+        self.sValue = ""
+        self.LastUpdate = ""
+        self.TimedOut = 0
+        self.updates = 0
+
+    def Create(self):
+        Devices[self.Unit] = self
+
+    def Update(self, nValue, sValue, TimedOut = 0, Type = None, Subtype = None, Switchtype = None, Options = None):
+        self.nValue = nValue
+        self.sValue = sValue
+        self.TimedOut = TimedOut
+        if Type is not None:
+            self.Type = Type
+        if Subtype is not None:
+            self.SubType = Subtype
+        if Switchtype is not None:
+            self.SwitchType = Switchtype
+        if Options is not None:
+            self.Options = Options
+        self.updates += 1
@@ -0,0 +1,122 @@
+#
+# Offline simulation of the ExportController against a load profile; no Domoticz and no inverter needed.
+#
+# The profile is a CSV file with the columns seconds, load_w and pv_w; each row holds until the next one.
+# The simulated inverter follows its active_power_limit with a first order delay, the simulated P1 meter
+# reports the grid power once per P1 period and the controller runs once per plugin interval.
+#
+# For every change in the profile the settling time is reported: the time until the grid power stays within
+# the band around the target, or the limit is saturated in the direction the controller wants to go.
+#
+# Usage: python tests/export_control_sim.py tests/profiles/household.csv --rated-power 5000 --interval 5 --p1-period 10
+#
+
+import argparse
+import csv
+import json
+import os
+import statistics
+import sys
+
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import domoticz_stub
+
+sys.modules.setdefault("Domoticz", domoticz_stub)
+
+import plugin
+
+PROFILE = os.path.join(os.path.dirname(__file__), "profiles", "household.csv")
+
+
+def load_profile(path):
+    with open(path, newline = "") as f:
+        return [(int(row["seconds"]), float(row["load_w"]), float(row["pv_w"])) for row in csv.DictReader(f)]
+
+
+def run(profile, options, interval = 5, p1_period = 10, response = 5.0, band = None):
+    controller = plugin.ExportController(options)
+    rated_power = controller.rated_power
+    band = band if band is not None else 0.03 * rated_power
+
+    start = datetime(2026, 6, 1, 12, 0, 0)
+    end = profile[-1][0]
+    events = [seconds for seconds, load, pv in profile[1:] if seconds < end]
+
+    limit = 100
+    production = 0.0
+    p1_grid = None
+    row = 0
+    unsettled = {}
+
+    for second in range(end):
+        while row + 1 < len(profile) and profile[row + 1][0] <= second:
+            row += 1
+        load, pv = profile[row][1], profile[row][2]
+
+        # The inverter moves towards the limited production; response is its time constant in seconds.
+
+        production += (min(pv, rated_power * limit / 100) - production) / max(1.0, response)
+        grid = load - production
+
+        if second % p1_period == 0:
+            p1_grid = grid
+
+        if second % interval == 0 and p1_grid is not None:
+            now = start + timedelta(seconds = second)
+            new_limit = controller.update(now, p1_grid, limit)
+            if new_limit is not None:
+                limit = new_limit
+                controller.written(now)
+
+        error = grid + controller.target
+        settled = (abs(error) <= band
+            or (error > 0 and limit >= controller.max_limit)
+            or (error < 0 and limit <= controller.min_limit))
+        if not settled:
+            unsettled[second] = True
+
+    # The settling time of an event is the last unsettled second before the next event.
+
+    settling = []
+    for index, event in enumerate(events):
+        following = events[index + 1] if index + 1 < len(events) else end
+        seconds = [second for second in range(event, following) if second in unsettled]
+        settling.append(None if seconds and seconds[-1] == following - 1 else (seconds[-1] - event + 1 if seconds else 0))
+
+    settled_times = [seconds for seconds in settling if seconds is not None]
+    return {
+        "duration": end,
+        "events": len(events),
+        "writes": controller.writes,
+        "writes_per_hour": round(controller.writes * 3600 / end, 1),
+        "settling": settling,
+        "settling_median": statistics.median(settled_times) if settled_times else None,
+        "settling_max": max(settled_times) if settled_times else None,
+        "not_settled": settling.count(None),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("profile", nargs = "?", default = PROFILE)
+    parser.add_argument("--rated-power", type = float, default = 5000)
+    parser.add_argument("--target", type = float, default = 0)
+    parser.add_argument("--kp", type = float, default = 0.5)
+    parser.add_argument("--ki", type = float, default = 0.1)
+    parser.add_argument("--max-step", type = float, default = 10)
+    parser.add_argument("--deadband", type = float, default = 2)
+    parser.add_argument("--min-interval", type = float, default = 10)
+    parser.add_argument("--interval", type = int, default = 5)
+    parser.add_argument("--p1-period", type = int, default = 10)
+    parser.add_argument("--response", type = float, default = 5.0)
+    args = parser.parse_args()
+
+    options = {
+        "rated_power": args.rated_power, "target": args.target, "kp": args.kp, "ki": args.ki,
+        "max_step": args.max_step, "deadband": args.deadband, "min_interval": args.min_interval,
+    }
+    print(json.dumps(run(load_profile(args.profile), options, args.interval, args.p1_period, args.response), indent = 4))
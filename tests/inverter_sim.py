@@ -0,0 +1,259 @@
+#
+# Simulation helpers to run the plugin without an inverter and without Domoticz.
+#
+# - FakeClock is passed to BasePlugin, so simulated days pass in seconds.
+# - InverterSimulator is a pymodbus server that serves the SolarEdge SunSpec registers
+#   of a single phase or a three phase inverter, following a simple day/night production profile.
+# - P1Simulator is a small web server that answers the Domoticz json api for a P1 device,
+#   which updates at a fixed period with some jitter.
+#
+
+import asyncio
+import json
+import math
+import random
+import socket
+import threading
+import time
+
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import solaredge_modbus
+
+from pymodbus.constants import Endian
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusSlaveContext
+from pymodbus.payload import BinaryPayloadBuilder
+from pymodbus.server import ModbusTcpServer
+
+registerDataType = solaredge_modbus.registerDataType
+
+
+class FakeClock:
+
+    def __init__(self, start):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def advance(self, seconds):
+        self.current += timedelta(seconds = seconds)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class InverterSimulator:
+
+    def __init__(self, sunspec_did = 103, serial = "7E1234567", peak_power = 5000, clip_power = 4000, port = None):
+        self.sunspec_did = sunspec_did
+        self.serial = serial
+        self.peak_power = peak_power
+        self.clip_power = clip_power
+        self.port = port or free_port()
+
+        # The register definitions of solaredge_modbus are used to encode the values.
+
+        self.registers = solaredge_modbus.Inverter(host = "127.0.0.1", port = self.port).registers
+
+        self.context = ModbusServerContext(
+            slaves = ModbusSlaveContext(hr = ModbusSequentialDataBlock(0, [0] * 0x10000), zero_mode = True),
+            single = True
+        )
+
+        self.energy_total = 1000000
+        self.last_update = None
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+        self.set_identity()
+        self.set("active_power_limit", 100)
+
+    # Register encoding
+
+    def set(self, name, value):
+        address, length, rtype, dtype, vtype, label, fmt, batch = self.registers[name]
+        builder = BinaryPayloadBuilder(byteorder = Endian.BIG, wordorder = Endian.BIG)
+
+        if dtype == registerDataType.STRING:
+            builder.add_string(value.ljust(length * 2, "\x00")[:length * 2])
+        elif dtype in (registerDataType.UINT32, registerDataType.ACC32):
+            builder.add_32bit_uint(value)
+        elif dtype == registerDataType.INT32:
+            builder.add_32bit_int(value)
+        elif dtype == registerDataType.FLOAT32:
+            builder.add_32bit_float(value)
+        elif dtype == registerDataType.INT16:
+            builder.add_16bit_int(value)
+        else:
+            builder.add_16bit_uint(value)
+
+        self.context[0].setValues(3, address, builder.to_registers())
+
+    def get(self, name):
+        address = self.registers[name][0]
+        return self.context[0].getValues(3, address, 1)[0]
+
+    def set_identity(self):
+        self.set("c_id", "SunS")
+        self.set("c_did", 1)
+        self.set("c_length", 65)
+        self.set("c_manufacturer", "SolarEdge")
+        self.set("c_model", "SE5K" if self.sunspec_did == 101 else "SE5K-RW0TEBEN4")
+        self.set("c_version", "0004.0019.0036")
+        self.set("c_serialnumber", self.serial)
+        self.set("c_deviceaddress", 1)
+        self.set("c_sunspec_did", self.sunspec_did)
+        self.set("c_sunspec_length", 50)
+
+        self.set("current_scale", -2)
+        self.set("voltage_scale", -1)
+        self.set("power_ac_scale", 0)
+        self.set("frequency_scale", -2)
+        self.set("power_apparent_scale", 0)
+        self.set("power_reactive_scale", 0)
+        self.set("power_factor_scale", -2)
+        self.set("energy_total_scale", 0)
+        self.set("current_dc_scale", -2)
+        self.set("voltage_dc_scale", -1)
+        self.set("power_dc_scale", 0)
+        self.set("temperature_scale", -2)
+
+    # Production profile
+
+    def production(self, now):
+        # Sun between 07:00 and 19:00, clipped at clip_power and limited by active_power_limit.
+
+        hour = now.hour + now.minute / 60 + now.second / 3600
+        if hour < 7 or hour >= 19:
+            return 0
+        power = self.peak_power * math.sin(math.pi * (hour - 7) / 12)
+        limit = self.get("active_power_limit")
+        return int(min(power, self.clip_power, self.peak_power * limit / 100))
+
+    def update(self, now):
+        power = self.production(now)
+
+        if self.last_update is not None:
+            self.energy_total += int(power * (now - self.last_update).total_seconds() / 3600)
+        self.last_update = now
+
+        phases = 1 if self.sunspec_did == 101 else 3
+        current = int(power / 230 / phases * 100)
+
+        self.set("status", 4 if power > 0 else 2)
+        self.set("vendor_status", 0)
+        self.set("current", current * phases)
+        for phase in range(1, 4):
+            self.set("l{}_current".format(phase), current if phase <= phases else 0xffff)
+            self.set("l{}_voltage".format(phase), 4000 if phases == 3 else (2300 if phase == 1 else 0xffff))
+            self.set("l{}n_voltage".format(phase), 2300 if phase <= phases else 0xffff)
+        self.set("power_ac", power)
+        self.set("frequency", 5000 if power > 0 else 0)
+        self.set("power_apparent", power)
+        self.set("power_reactive", 0)
+        self.set("power_factor", 10000 if power > 0 else 0)
+        self.set("energy_total", self.energy_total)
+        self.set("current_dc", int(power * 1.03 / 380 * 100))
+        self.set("voltage_dc", 3800 if power > 0 else 0)
+        self.set("power_dc", int(power * 1.03))
+        self.set("temperature", 3000 + int(power / 2) if power > 0 else 2000)
+
+    # Server
+
+    def start(self):
+        ready = threading.Event()
+
+        async def serve():
+            self.loop = asyncio.get_running_loop()
+            self.server = ModbusTcpServer(self.context, address = ("127.0.0.1", self.port))
+            ready.set()
+            await self.server.serve_forever()
+
+        def run():
+            asyncio.run(serve())
+
+        self.thread = threading.Thread(name = "InverterSimulator", target = run, daemon = True)
+        self.thread.start()
+        ready.wait(5)
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout = 0.2):
+                    return
+            except OSError:
+                time.sleep(0.05)
+        raise RuntimeError("Inverter simulator did not start")
+
+    def stop(self):
+        if self.server:
+            asyncio.run_coroutine_threadsafe(self.server.shutdown(), self.loop).result(5)
+            self.thread.join(5)
+            self.server = None
+
+
+class P1Simulator:
+
+    def __init__(self, clock, idx = 5, period = 10, jitter = 1.0, seed = 1):
+        self.clock = clock
+        self.idx = idx
+        self.period = period
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.last_update = clock.now()
+        self.next_update = self.last_update + timedelta(seconds = period)
+        self.grid_power = 0.0
+        self.requests = 0
+        self.server = None
+        self.thread = None
+
+    def device(self):
+        # Catch up with the fake clock; each P1 update happens period +/- jitter seconds after the previous one.
+
+        now = self.clock.now()
+        while self.next_update <= now:
+            self.last_update = self.next_update
+            self.next_update += timedelta(seconds = self.period + self.random.uniform(-self.jitter, self.jitter))
+
+        return {
+            "idx": str(self.idx),
+            "Name": "Power",
+            "LastUpdate": self.last_update.strftime("%Y-%m-%d %H:%M:%S"),
+            "Usage": "{:.0f} Watt".format(max(0.0, self.grid_power)),
+            "UsageDeliv": "{:.0f} Watt".format(max(0.0, -self.grid_power)),
+        }
+
+    def start(self):
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                simulator.requests += 1
+                body = json.dumps({ "status": "OK", "result": [simulator.device()] }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(name = "P1Simulator", target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+        return "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join(5)
+            self.server = None
@@ -0,0 +1,130 @@
+#
+# Tests for the DailyMetrics: the day rollover, restoring the state after a restart and the time weighting.
+#
+
+from datetime import datetime, timedelta
+
+import plugin
+
+from inverter_sim import FakeClock
+
+
+def values(energy_total, power_ac = 0, power_dc = 0):
+    return {
+        "energy_total": energy_total, "energy_total_scale": 0,
+        "power_ac": power_ac, "power_ac_scale": 0,
+        "power_dc": power_dc, "power_dc_scale": 0,
+    }
+
+
+def test_day_rollover():
+    metrics = plugin.DailyMetrics()
+    now = datetime(2026, 6, 1, 23, 59, 0)
+
+    assert metrics.update(now, values(100000, 0, 0)) == { "daily_yield": 0.0, "peak_power": 0, "efficiency": 0.0 }
+    assert metrics.rollover
+    metrics.rollover = False
+
+    result = metrics.update(now + timedelta(seconds = 30), values(101500, 3000, 3100))
+    assert result["daily_yield"] == 1.5
+    assert result["peak_power"] == 3000
+    assert not metrics.rollover
+
+    # A new day starts counting from the energy_total at that moment.
+
+    result = metrics.update(now + timedelta(seconds = 60), values(101600, 1000, 1100))
+    assert metrics.rollover
+    assert metrics.day == "2026-06-02"
+    assert result == { "daily_yield": 0.0, "peak_power": 1000, "efficiency": 0.0 }
+
+
+def test_missing_values():
+    assert plugin.DailyMetrics().update(datetime(2026, 6, 1, 12, 0, 0), { "power_ac": 1000 }) == {}
+
+
+def test_efficiency_is_weighted_by_time():
+    metrics = plugin.DailyMetrics()
+    now = datetime(2026, 6, 1, 12, 0, 0)
+
+    metrics.update(now, values(100000, 1000, 1100))
+    metrics.update(now + timedelta(seconds = 10), values(100000, 1000, 1100))
+    result = metrics.update(now + timedelta(seconds = 70), values(100000, 2000, 2100))
+
+    # 10 seconds at 1000/1100 W and 60 seconds at 2000/2100 W.
+
+    assert result["efficiency"] == round(100 * (1000 * 10 + 2000 * 60) / (1100 * 10 + 2100 * 60), 1)
+
+
+def test_gaps_are_not_integrated():
+    metrics = plugin.DailyMetrics()
+    now = datetime(2026, 6, 1, 12, 0, 0)
+
+    metrics.update(now, values(100000, 1000, 1100))
+    metrics.update(now + timedelta(seconds = 10), values(100000, 1000, 1100))
+    result = metrics.update(now + timedelta(seconds = 10 + metrics.max_gap + 1), values(100000, 1000, 2000))
+
+    assert result["efficiency"] == round(100 * 1000 / 1100, 1)
+    assert metrics.energy_dc == 1100 * 10
+
+
+def test_energy_total_reset():
+    metrics = plugin.DailyMetrics()
+    now = datetime(2026, 6, 1, 12, 0, 0)
+
+    metrics.update(now, values(100000))
+    assert metrics.update(now + timedelta(seconds = 10), values(102000))["daily_yield"] == 2.0
+
+    # A replaced inverter starts again at a lower energy_total; the day continues from there.
+
+    assert metrics.update(now + timedelta(seconds = 20), values(500))["daily_yield"] == 0.0
+    assert metrics.update(now + timedelta(seconds = 30), values(1500))["daily_yield"] == 1.0
+
+
+def test_state_survives_a_restart(domoticz):
+    clock = FakeClock(datetime(2026, 6, 1, 12, 0, 0))
+    first = plugin.BasePlugin(clock = clock.now)
+    first.metrics.update(clock.now(), values(100000, 1000, 1100))
+    clock.advance(60)
+    before = first.metrics.update(clock.now(), values(103000, 2000, 2200))
+    first.onStop()
+
+    assert domoticz.Configuration()["DailyMetrics"]["day"] == "2026-06-01"
+
+    clock.advance(120)
+    second = plugin.BasePlugin(clock = clock.now)
+    second.loadMetrics()
+    after = second.metrics.update(clock.now(), values(103000, 2000, 2200))
+
+    assert not second.metrics.rollover
+    assert after["daily_yield"] == before["daily_yield"] == 3.0
+    assert after["efficiency"] == before["efficiency"]
+
+
+def test_state_of_another_day_is_ignored(domoticz):
+    domoticz.Configuration({ "DailyMetrics": { "day": "2026-05-31", "energy_start": 90000, "energy_ac": 1.0, "energy_dc": 2.0 } })
+
+    p = plugin.BasePlugin(clock = FakeClock(datetime(2026, 6, 1, 8, 0, 0)).now)
+    p.loadMetrics()
+
+    assert p.metrics.day is None
+    assert p.metrics.energy_start is None
+
+
+def test_peak_is_read_back_from_the_device(domoticz):
+    domoticz.Configuration({ "DailyMetrics": { "day": "2026-06-01", "energy_start": 100000 } })
+    device = domoticz.Device(Name = "Peak Power", Unit = plugin.Unit.PEAK_POWER, Type = 0xF8, Subtype = 0x01)
+    device.Create()
+    device.sValue = "3456"
+    device.LastUpdate = "2026-06-01 11:58:00"
+
+    p = plugin.BasePlugin(clock = FakeClock(datetime(2026, 6, 1, 12, 0, 0)).now)
+    p.loadMetrics()
+    assert p.metrics.peak == 3456
+    assert p.metrics.update(datetime(2026, 6, 1, 12, 0, 5), values(100000, 1000, 1100))["peak_power"] == 3456
+
+    # A peak of yesterday is not used.
+
+    device.LastUpdate = "2026-05-31 13:00:00"
+    p = plugin.BasePlugin(clock = FakeClock(datetime(2026, 6, 1, 12, 0, 0)).now)
+    p.loadMetrics()
+    assert p.metrics.peak == 0.0
@@ -0,0 +1,139 @@
+#
+# Tests for the zero export control: the offline simulation, stale P1 readings and failed writes.
+#
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import plugin
+
+from export_control_sim import PROFILE, load_profile, run
+from inverter_sim import FakeClock
+
+
+def test_household_profile_settles():
+    result = run(load_profile(PROFILE), { "rated_power": 5000 })
+
+    assert result["not_settled"] == 0
+    assert result["settling_median"] <= 60
+    assert result["settling_max"] <= 180
+    assert result["writes_per_hour"] <= 150
+
+
+class Response:
+
+    def __init__(self, error):
+        self.error = error
+
+    def isError(self):
+        return self.error
+
+
+class FakeInverter:
+
+    def __init__(self, error = False):
+        self.error = error
+        self.writes = []
+
+    def write(self, key, value):
+        self.writes.append((key, value))
+        return Response(self.error)
+
+
+@pytest.fixture
+def controlled(domoticz):
+    plugin.Parameters["Mode5"] = str(int(plugin.Log.VERBOSE))
+    clock = FakeClock(datetime(2026, 6, 1, 12, 0, 0))
+    p = plugin.BasePlugin(clock = clock.now)
+    p.controller = plugin.ExportController({ "rated_power": 5000, "min_interval": 0 })
+    p.controller_idx = 5
+    p.inverter = FakeInverter()
+
+    def cycle(grid_power, age = 0, limit = 100):
+        p.p1_result = {
+            "idx": "5",
+            "LastUpdate": (clock.now() - timedelta(seconds = age)).strftime("%Y-%m-%d %H:%M:%S"),
+            "Usage": "{:.0f} Watt".format(max(0, grid_power)),
+            "UsageDeliv": "{:.0f} Watt".format(max(0, -grid_power)),
+        }
+        p.controlExport({ "active_power_limit": limit })
+        clock.advance(5)
+
+    p.cycle = cycle
+    return p
+
+
+def test_stale_p1_pauses_control(controlled, domoticz):
+    controlled.cycle(-2000)
+    controlled.cycle(-2000)
+    assert len(controlled.inverter.writes) == 1
+
+    # An old reading keeps the limit as it is.
+
+    controlled.cycle(-2000, age = 120)
+    controlled.cycle(-2000, age = 125)
+    assert len(controlled.inverter.writes) == 1
+    assert controlled.controller.stale
+    assert sum("zero export control paused" in msg for kind, msg in domoticz.Messages) == 1
+
+    # Once the P1 device updates again, the controller starts again from the limit of the inverter.
+
+    controlled.cycle(-2000)
+    assert not controlled.controller.stale
+    assert len(controlled.inverter.writes) == 1
+    controlled.cycle(-2000)
+    assert len(controlled.inverter.writes) == 2
+
+
+def test_failed_writes_are_not_counted(controlled, domoticz):
+    controlled.inverter.error = True
+    controlled.cycle(-2000)
+    controlled.cycle(-2000)
+    controlled.cycle(-2000)
+
+    assert len(controlled.inverter.writes) == 2
+    assert controlled.controller.writes == 0
+    assert controlled.controller.last_write_time is None
+    assert any(kind == "Error" and "active_power_limit" in msg for kind, msg in domoticz.Messages)
+
+    controlled.inverter.error = False
+    controlled.cycle(-2000)
+    assert controlled.controller.writes == 1
+
+
+def test_manual_level_holds_control(controlled, domoticz):
+    controlled.cycle(-2000)
+    controlled.onCommand(plugin.Unit.POWERCONTROL, "Set Level", 60, 0)
+    assert controlled.inverter.writes == [("active_power_limit", 60)]
+
+    # The control loop would lower the limit, but the manual level is kept.
+
+    for cycle in range(20):
+        controlled.cycle(-2000, limit = 60)
+    assert controlled.inverter.writes == [("active_power_limit", 60)]
+    assert controlled.controller.held
+
+    # Back at 100%, the control loop takes over again.
+
+    controlled.onCommand(plugin.Unit.POWERCONTROL, "Set Level", 100, 0)
+    controlled.cycle(-2000)
+    controlled.cycle(-2000)
+    assert not controlled.controller.held
+    assert controlled.inverter.writes[-1][1] < 100
+
+
+def test_manual_hold_expires(controlled, domoticz):
+    controlled.controller = plugin.ExportController({ "rated_power": 5000, "min_interval": 0, "manual_hold": 30 })
+    controlled.cycle(-2000)
+    controlled.onCommand(plugin.Unit.POWERCONTROL, "Set Level", 60, 0)
+
+    for cycle in range(6):
+        controlled.cycle(-2000, limit = 60)
+    assert len(controlled.inverter.writes) == 1
+
+    controlled.cycle(-2000, limit = 60)
+    controlled.cycle(-2000, limit = 60)
+    assert not controlled.controller.held
+    assert any("Manual hold ended" in msg for kind, msg in domoticz.Messages)
+    assert controlled.inverter.writes[-1][1] < 60
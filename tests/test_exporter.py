@@ -0,0 +1,225 @@
+#
+# Tests for the LineProtocolExporter, using a local UDP socket, a local HTTP server and temporary files as targets.
+#
+
+import json
+import socket
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import plugin
+
+VALUES = {
+    "c_serialnumber": "7E1234567",
+    "status": 4,
+    "power_ac": 2500,
+    "power_ac_scale": 0,
+    "l1_voltage": 2301,
+    "voltage_scale": -1,
+    "energy_total": 1000000,
+    "energy_total_scale": 0,
+}
+
+TABLE = [unit for unit in plugin.SINGLE_PHASE_INVERTER if unit[plugin.Column.MODBUSNAME] in VALUES]
+
+
+class UdpReceiver:
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.target = "udp://127.0.0.1:{}".format(self.sock.getsockname()[1])
+
+    def lines(self, count, timeout = 5):
+        lines = []
+        deadline = time.monotonic() + timeout
+        while len(lines) < count and time.monotonic() < deadline:
+            try:
+                lines += self.sock.recv(65535).decode("utf-8").splitlines()
+            except socket.timeout:
+                pass
+        return lines
+
+    def close(self):
+        self.sock.close()
+
+
+class HttpReceiver:
+
+    def __init__(self, token = None):
+        self.bodies = []
+        self.headers = []
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+                receiver.headers.append(self.headers)
+                if token and self.headers.get("Authorization") != "Token {}".format(token):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                receiver.bodies.append(body)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+        self.target = "http://127.0.0.1:{}/write?db=solar".format(self.server.server_address[1])
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def udp():
+    receiver = UdpReceiver()
+    yield receiver
+    receiver.close()
+
+
+@pytest.fixture
+def http():
+    receiver = HttpReceiver()
+    yield receiver
+    receiver.close()
+
+
+def test_line_format():
+    exporter = plugin.LineProtocolExporter({ "target": "file:///tmp/unused.lp", "tags": { "site": "my roof", "a,b": "c=d" } })
+    line = exporter.format_line(1700000000000000000, plugin.scaled_values(TABLE, VALUES))
+
+    assert line == ("solaredge,site=my\\ roof,a\\,b=c\\=d "
+                    "status=4,l1_voltage=230.10000000000002,power_ac=2500,energy_total=1000000 1700000000000000000")
+    assert exporter.format_line(1, {}) is None
+
+
+def test_udp_batches_by_size(udp):
+    exporter = plugin.LineProtocolExporter({ "target": udp.target, "batch_size": 10, "flush_interval": 60 })
+    exporter.start()
+    try:
+        for i in range(10):
+            exporter.add(i, TABLE, VALUES)
+        lines = udp.lines(10, timeout = 2)
+    finally:
+        exporter.stop()
+
+    assert [line.rsplit(" ", 1)[1] for line in lines] == [str(i) for i in range(10)]
+    assert exporter.exported == 10
+
+
+def test_udp_splits_large_batches(udp):
+    exporter = plugin.LineProtocolExporter({ "target": udp.target, "batch_size": 200 })
+    for i in range(200):
+        exporter.add(i, TABLE, VALUES)
+    exporter.flush()
+
+    assert len(udp.lines(200)) == 200
+
+
+def test_http_batches_by_time(http):
+    exporter = plugin.LineProtocolExporter({ "target": http.target, "batch_size": 1000, "flush_interval": 1 })
+    exporter.start()
+    try:
+        for i in range(3):
+            exporter.add(i, TABLE, VALUES)
+        time.sleep(0.3)
+        assert http.bodies == []
+
+        deadline = time.monotonic() + 3
+        while not http.bodies and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        exporter.stop()
+
+    assert len(http.bodies) == 1
+    assert len(http.bodies[0].splitlines()) == 3
+    assert exporter.exported == 3
+
+
+def test_http_token_and_headers():
+    receiver = HttpReceiver(token = "secret")
+    try:
+        exporter = plugin.LineProtocolExporter({ "target": receiver.target, "token": "secret", "headers": { "X-Site": "roof" } })
+        exporter.add(1, TABLE, VALUES)
+        exporter.flush()
+
+        # Without the token, the write is refused like InfluxDB does.
+
+        refused = plugin.LineProtocolExporter({ "target": receiver.target })
+        refused.add(2, TABLE, VALUES)
+        refused.flush()
+    finally:
+        receiver.close()
+
+    assert len(receiver.bodies) == 1
+    assert receiver.headers[0]["X-Site"] == "roof"
+    assert exporter.exported == 1
+    assert refused.failed == 1
+    assert "401" in refused.take_error()
+
+
+def test_http_failure_is_reported():
+    exporter = plugin.LineProtocolExporter({ "target": "http://127.0.0.1:1/write" })
+    exporter.add(1, TABLE, VALUES)
+    exporter.flush()
+
+    assert exporter.failed == 1
+    assert exporter.take_error()
+    assert exporter.take_error() is None
+
+
+def test_max_queue_drops_oldest(tmp_path):
+    target = tmp_path / "samples.lp"
+    exporter = plugin.LineProtocolExporter({ "target": str(target), "batch_size": 5, "max_queue": 5 })
+    for i in range(8):
+        exporter.add(i, TABLE, VALUES)
+    exporter.flush()
+
+    assert exporter.dropped == 3
+    assert exporter.exported == 5
+    assert [line.rsplit(" ", 1)[1] for line in target.read_text().splitlines()] == ["3", "4", "5", "6", "7"]
+
+
+def test_file_rotation(tmp_path):
+    target = tmp_path / "samples.lp"
+    exporter = plugin.LineProtocolExporter({ "target": "file://" + str(target), "batch_size": 1, "max_bytes": 50, "backup_count": 2 })
+    for i in range(5):
+        exporter.add(i, TABLE, VALUES)
+        exporter.flush()
+
+    # Every line is longer than max_bytes, so each write ends up in a new file; only 2 backups are kept.
+
+    assert target.read_text().endswith(" 4\n")
+    assert (tmp_path / "samples.lp.1").read_text().endswith(" 3\n")
+    assert (tmp_path / "samples.lp.2").read_text().endswith(" 2\n")
+    assert not (tmp_path / "samples.lp.3").exists()
+
+
+@pytest.mark.parametrize("target", ["tcp://127.0.0.1:8089", "udp://127.0.0.1", "file://", "http:///write"])
+def test_invalid_targets(target):
+    with pytest.raises(ValueError):
+        plugin.LineProtocolExporter({ "target": target })
+
+
+def test_invalid_target_reported_on_start(domoticz, tmp_path):
+    (tmp_path / "options.json").write_text(json.dumps({ "export": { "target": "tcp://127.0.0.1:8089" } }))
+    plugin.Parameters["Port"] = "1"
+
+    instance = plugin.BasePlugin()
+    instance.retryafter = instance.clock() + instance.retrydelay
+    instance.onStart()
+
+    assert instance.exporter is None
+    assert any(kind == "Error" and "tcp://127.0.0.1:8089" in msg for kind, msg in domoticz.Messages)
@@ -0,0 +1,131 @@
+#
+# Tests for the SnapshotServer: conditional requests, the event stream and a small run of the benchmark.
+#
+
+import http.client
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import plugin
+
+from bench_snapshot import free_port, run
+
+
+@pytest.fixture
+def server():
+    server = plugin.SnapshotServer({ "port": free_port(), "keepalive": 1 })
+    server.start()
+    yield server
+    server.stop()
+
+
+def get_snapshot(server, etag = None):
+    request = urllib.request.Request(
+        "http://{}:{}/snapshot".format(server.host, server.port),
+        headers = { "If-None-Match": etag } if etag else {}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout = 5) as response:
+            return response.status, response.headers["ETag"], response.headers["X-Updated"], json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers["ETag"], e.headers["X-Updated"], None
+
+
+class Subscriber:
+
+    def __init__(self, server):
+        self.events = []
+        self.connection = http.client.HTTPConnection(server.host, server.port, timeout = 5)
+        self.connection.request("GET", "/events")
+        self.response = self.connection.getresponse()
+        self.thread = threading.Thread(target = self.read, daemon = True)
+        self.thread.start()
+
+    def read(self):
+        event = None
+        while True:
+            line = self.response.fp.readline()
+            if not line:
+                return
+            if line.startswith(b"event: "):
+                event = line[7:].decode().strip()
+            elif line.startswith(b"data: "):
+                self.events.append((event, json.loads(line[6:])))
+
+    def wait(self, count):
+        deadline = time.monotonic() + 5
+        while len(self.events) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.events
+
+
+def test_snapshot_etag(server):
+    server.publish("2026-06-01T12:00:00", { "power_ac": 2500 })
+
+    status, etag, updated, body = get_snapshot(server)
+    assert status == 200
+    assert updated == "2026-06-01T12:00:00"
+    assert body == { "changed": "2026-06-01T12:00:00", "values": { "power_ac": 2500 } }
+
+    status, same, updated, body = get_snapshot(server, etag)
+    assert status == 304
+    assert same == etag
+
+
+def test_steady_values_keep_the_etag(server):
+    server.publish("2026-06-01T12:00:00", { "power_ac": 2500 })
+    status, etag, updated, body = get_snapshot(server)
+
+    # Only the time of the last read advances; a poller gets a 304 with the new time.
+
+    server.publish("2026-06-01T12:00:05", { "power_ac": 2500 })
+    status, same, updated, body = get_snapshot(server, etag)
+    assert status == 304
+    assert same == etag
+    assert updated == "2026-06-01T12:00:05"
+
+    server.publish("2026-06-01T12:00:10", { "power_ac": 2400 })
+    status, new_etag, updated, body = get_snapshot(server, etag)
+    assert status == 200
+    assert new_etag != etag
+    assert body == { "changed": "2026-06-01T12:00:10", "values": { "power_ac": 2400 } }
+
+
+def test_events_send_changes_and_removed_values(server):
+    server.publish("2026-06-01T12:00:00", { "power_ac": 2500, "power_dc": 2600 })
+    subscriber = Subscriber(server)
+    subscriber.wait(1)
+
+    server.publish("2026-06-01T12:00:05", { "power_ac": 2400, "power_dc": 2600 })
+    subscriber.wait(2)
+    server.publish("2026-06-01T12:00:10", { "power_ac": 2400 })
+    subscriber.wait(3)
+
+    # Steady values don't send a change event; the next event is the keepalive with the time of the last read.
+
+    server.publish("2026-06-01T12:00:15", { "power_ac": 2400 })
+    events = subscriber.wait(4)
+
+    assert events[0] == ("snapshot", { "updated": "2026-06-01T12:00:00", "changed": "2026-06-01T12:00:00",
+                                       "values": { "power_ac": 2500, "power_dc": 2600 } })
+    assert events[1] == ("change", { "updated": "2026-06-01T12:00:05", "changed": "2026-06-01T12:00:05", "values": { "power_ac": 2400 } })
+    assert events[2] == ("change", { "updated": "2026-06-01T12:00:10", "changed": "2026-06-01T12:00:10", "values": { "power_dc": None } })
+    assert events[3] == ("keepalive", { "updated": "2026-06-01T12:00:15" })
+
+
+def test_unknown_path(server):
+    with pytest.raises(urllib.error.HTTPError) as e:
+        urllib.request.urlopen("http://{}:{}/other".format(server.host, server.port), timeout = 5)
+    assert e.value.code == 404
+
+
+def test_benchmark_delivers_all_events():
+    result = run(subscribers = 20, pollers = 2, publishes = 10, interval = 0.02)
+
+    assert result["delivered"] == result["expected"]
+    assert result["polls_200"] > 0
@@ -0,0 +1,217 @@
+#
+# Soak tests: run the plugin against a simulated inverter for whole simulated days.
+#
+# The fake clock is advanced by the heartbeat interval the plugin asked for, so the P1 sync and retry logic
+# see the same timing as in Domoticz. Each test keeps track of the time spent per heartbeat,
+# the number of device updates and the memory allocated by the plugin.
+#
+
+import tracemalloc
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import plugin
+
+from inverter_sim import FakeClock, InverterSimulator, P1Simulator
+
+
+class Soak:
+
+    def __init__(self, domoticz, simulator, clock, **parameters):
+        self.domoticz = domoticz
+        self.simulator = simulator
+        self.clock = clock
+        self.latencies = []
+        self.polls = 0
+
+        plugin.Parameters.update(parameters)
+        plugin.Parameters["Port"] = str(simulator.port)
+
+        self.plugin = plugin.BasePlugin(clock = clock.now)
+        self.plugin.onStart()
+
+    def run(self, seconds, step = None):
+        end = self.clock.now() + timedelta(seconds = seconds)
+        while self.clock.now() < end:
+            self.clock.advance(self.domoticz.Heartbeat())
+            self.simulator.update(self.clock.now())
+
+            writes = self.plugin.stats.device_writes
+            self.plugin.onHeartbeat()
+            self.latencies.append(self.plugin.stats.last_time)
+            self.polls += self.plugin.polled
+
+            assert self.plugin.stats.device_writes - writes <= len(self.domoticz.Devices)
+            if step:
+                step(self)
+
+    def stop(self):
+        self.plugin.onStop()
+
+    def errors(self):
+        return [msg for kind, msg in self.domoticz.Messages if kind == "Error"]
+
+
+@pytest.fixture
+def simulator():
+    simulators = []
+
+    def start(**kwargs):
+        sim = InverterSimulator(**kwargs)
+        sim.start()
+        simulators.append(sim)
+        return sim
+
+    yield start
+
+    for sim in simulators:
+        sim.stop()
+
+
+def plugin_traced(snapshot):
+    return sum(stat.size for stat in snapshot.filter_traces([tracemalloc.Filter(True, plugin.__file__)]).statistics("filename"))
+
+
+def test_three_phase_days_with_connection_drop(domoticz, simulator):
+    sim = simulator(sunspec_did = 103)
+    clock = FakeClock(datetime(2026, 6, 1, 0, 0, 0))
+    soak = Soak(domoticz, sim, clock, Mode2 = "60")
+
+    states = {}
+
+    def record_status(soak):
+        now = soak.clock.now()
+        if now.minute == 0 and plugin.Unit.STATUS in domoticz.Devices:
+            states[now.hour] = domoticz.Devices[plugin.Unit.STATUS].sValue
+
+    # Day 1 is used to warm up; all devices get created and every code path runs at least once.
+
+    soak.run(24 * 3600, record_status)
+    assert states[3] == "Sleeping"
+    assert states[12] == "Producing"
+    assert len(domoticz.Devices) == len(plugin.THREE_PHASE_INVERTER)
+
+    tracemalloc.start(10)
+    try:
+        before = tracemalloc.take_snapshot()
+
+        # Night: the values don't change, so after the sliding windows are filled nothing gets processed.
+
+        writes = soak.plugin.stats.device_writes
+        skipped = soak.plugin.stats.skipped
+        soak.run(6 * 3600)
+        assert soak.plugin.stats.device_writes - writes <= len(domoticz.Devices)
+        assert soak.plugin.stats.skipped - skipped >= 6 * 60 - 10
+
+        # Day: production and a connection drop around noon.
+
+        soak.run(6 * 3600)
+        latencies = len(soak.latencies)
+        sim.stop()
+        soak.run(180)
+        sim.start()
+        soak.run(300)
+        drop = slice(latencies, len(soak.latencies))
+
+        updates = domoticz.Devices[plugin.Unit.ENERGY_TOTAL].updates
+        soak.run(3600)
+        assert domoticz.Devices[plugin.Unit.ENERGY_TOTAL].updates > updates
+        assert float(domoticz.Devices[plugin.Unit.DAILY_YIELD].sValue) > 10
+
+        soak.run(24 * 3600 - 6 * 3600 - 6 * 3600 - 180 - 300 - 3600)
+
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    soak.stop()
+
+    # The aggregators may not grow beyond their sliding window.
+
+    for unit in plugin.THREE_PHASE_INVERTER:
+        if unit[plugin.Column.MATH]:
+            assert len(unit[plugin.Column.MATH].samples) <= soak.plugin.max_samples
+
+    # Memory allocated in the plugin should not grow from one day to the next.
+
+    assert plugin_traced(after) - plugin_traced(before) < 64 * 1024
+
+    latencies = soak.latencies[:drop.start] + soak.latencies[drop.stop:]
+    # The heartbeats are measured while tracemalloc is running, which makes them a lot slower.
+
+    assert max(latencies) < 1.0
+    assert sorted(latencies)[int(len(latencies) * 0.99)] < 0.25
+
+    # The simulation ends at midnight, so a new day has just started.
+
+    assert domoticz.Devices[plugin.Unit.DAILY_YIELD].sValue == "0.000"
+    assert soak.errors() == []
+
+
+def test_single_phase_with_p1_jitter(domoticz, simulator):
+    sim = simulator(sunspec_did = 101)
+    clock = FakeClock(datetime(2026, 6, 1, 10, 0, 0))
+    p1 = P1Simulator(clock, idx = 5, period = 10, jitter = 2.0)
+    url = p1.start()
+
+    try:
+        heartbeats = []
+
+        def record_heartbeat(soak):
+            heartbeats.append(domoticz.Heartbeat())
+
+        soak = Soak(domoticz, sim, clock, Mode2 = "5", Mode6 = "5")
+        soak.plugin.domoticz_url = url
+
+        # One hour synced with the P1 updates; the plugin polls once per P1 update.
+
+        start = p1.next_update
+        soak.run(3600, record_heartbeat)
+        p1_updates = (p1.last_update - start).total_seconds() / p1.period
+
+        assert len(domoticz.Devices) == len(plugin.SINGLE_PHASE_INVERTER)
+        assert soak.plugin.p1_idx == 5
+        assert abs(soak.polls - p1_updates) <= p1_updates * 0.2
+        assert all(1 <= interval <= 30 for interval in heartbeats)
+
+        # When the P1 device stops updating, the plugin goes back to the configured interval.
+
+        p1.period = 24 * 3600
+        soak.run(600)
+        assert soak.plugin.p1_idx == 0
+        assert domoticz.Heartbeat() == 5
+
+        polls = soak.polls
+        soak.run(300)
+        assert soak.polls - polls == 60
+
+        soak.stop()
+        assert soak.errors() == []
+    finally:
+        p1.stop()
+
+
+def test_restart_uses_cached_discovery(domoticz, simulator):
+    sim = simulator(sunspec_did = 103)
+    clock = FakeClock(datetime(2026, 6, 1, 12, 0, 0))
+
+    soak = Soak(domoticz, sim, clock)
+    soak.run(60)
+    soak.stop()
+    assert not any("Using cached discovery" in msg for kind, msg in domoticz.Messages)
+
+    plugin.Parameters["Mode5"] = "2"
+    soak = Soak(domoticz, sim, clock)
+    assert soak.plugin._LOOKUP_TABLE is plugin.THREE_PHASE_INVERTER
+    assert any("Using cached discovery" in msg for kind, msg in domoticz.Messages)
+
+    # A different inverter on the same address gets a full discovery.
+
+    sim.stop()
+    other = simulator(sunspec_did = 101, serial = "7E7654321", port = sim.port)
+    domoticz.Messages.clear()
+    soak = Soak(domoticz, other, clock)
+    assert soak.plugin._LOOKUP_TABLE is plugin.SINGLE_PHASE_INVERTER
+    assert any("identity changed" in msg for kind, msg in domoticz.Messages)
@@ -0,0 +1,96 @@
+#
+# Tests for the CycleThrottle and how the plugin uses it.
+#
+
+from datetime import datetime
+
+import plugin
+
+from inverter_sim import FakeClock
+
+
+def run(throttle, clock, duration, cycles):
+    # Runs heartbeats of the configured interval and returns the number of cycles that were not skipped.
+
+    polled = 0
+    for cycle in range(cycles):
+        clock.advance(throttle.interval)
+        if throttle.due(clock.now()):
+            throttle.update(clock.now(), duration)
+            polled += 1
+    return polled
+
+
+def test_steady_slow_cycles_settle():
+    clock = FakeClock(datetime(2026, 6, 1, 12, 0, 0))
+    throttle = plugin.CycleThrottle(1, budget = 0.5, max_factor = 8)
+
+    # 0.6s is over the budget of a 1s interval, but well within the budget of a 2s interval.
+
+    run(throttle, clock, 0.6, 100)
+    assert throttle.factor == 2
+    assert throttle.events == 1
+    assert throttle.get_budget() == 1.0
+
+
+def test_stretch_and_restore():
+    clock = FakeClock(datetime(2026, 6, 1, 12, 0, 0))
+    throttle = plugin.CycleThrottle(1, budget = 0.5, max_factor = 8)
+
+    run(throttle, clock, 10, 100)
+    assert throttle.factor == 8
+    assert run(throttle, clock, 10, 80) == 10
+
+    run(throttle, clock, 0.1, 500)
+    assert throttle.factor == 1
+    assert throttle.next_cycle is None
+    assert run(throttle, clock, 0.1, 10) == 10
+
+
+def test_no_throttle_while_synced_with_p1(domoticz):
+    p = plugin.BasePlugin()
+    p.processHeartbeat = lambda: setattr(p, "polled", True)
+
+    # With no budget at all, every polled cycle is too slow.
+
+    p.throttle = plugin.CycleThrottle(5, budget = 0)
+    p.p1_idx = 5
+    for cycle in range(10):
+        p.onHeartbeat()
+    assert p.throttle.factor == 1
+    assert p.throttle.next_cycle is None
+
+    # When the P1 device stops updating, the plugin falls back to the interval and the throttle applies again.
+
+    p.p1_idx = 0
+    for cycle in range(3):
+        p.onHeartbeat()
+    assert p.throttle.factor == 2
+
+
+def test_math_windows_follow_the_interval(domoticz):
+    p = plugin.BasePlugin()
+    p.processHeartbeat = lambda: setattr(p, "polled", True)
+    p._LOOKUP_TABLE = plugin.THREE_PHASE_INVERTER
+    p.max_samples = 300 / 5
+    p.setMathSamples()
+
+    p.throttle = plugin.CycleThrottle(5, budget = 0)
+    for cycle in range(3):
+        p.onHeartbeat()
+    assert p.throttle.factor == 2
+
+    # The averages and maximums still cover 5 minutes: 30 samples of 10 seconds.
+
+    assert p.max_samples == 30
+    math = [unit[plugin.Column.MATH] for unit in p._LOOKUP_TABLE if unit[plugin.Column.MATH]]
+    assert math and all(m.max_samples == 30 for m in math)
+
+    # Once the interval is restored, so are the windows.
+
+    p.throttle.budget = 1
+    for cycle in range(10):
+        p.onHeartbeat()
+    assert p.throttle.factor == 1
+    assert p.max_samples == 60
+    assert all(m.max_samples == 60 for m in math)